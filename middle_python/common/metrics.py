@@ -0,0 +1,210 @@
+# Общий модуль hw1 и hw2. Задания запускаются каждое из своего каталога и не являются пакетами,
+# поэтому их модули добавляют каталог common в sys.path
+import json
+import os
+import sys
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+from time import localtime, perf_counter, strftime, time
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics:
+    """Инструментовка запуска: таймеры стадий, счётчики и гистограммы.
+       Потокобезопасна, каждый замер - один короткий захват блокировки"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = time()
+            self.timers: Dict[str, List[float]] = {}  # имя -> [количество, сумма, максимум]
+            self.counters: Dict[str, float] = {}
+            self.histograms: Dict[str, Tuple[tuple, List[int]]] = {}  # имя -> (границы, количества)
+            self.error: 'str | None' = None  # ошибка, обработанная внутри запуска
+
+    def add_time(self, name: str, seconds: float):
+        """Добавляет длительность одного выполнения стадии name"""
+        with self.lock:
+            timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Замеряет время выполнения блока как стадию name"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, perf_counter() - start)
+
+    def count(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS):
+        """Добавляет значение в гистограмму name (последняя корзина - больше всех границ)"""
+        with self.lock:
+            bounds, counts = self.histograms.setdefault(name, (buckets, [0] * (len(buckets) + 1)))
+            counts[bisect_left(bounds, value)] += 1
+
+    def fail(self, error: 'BaseException | str'):
+        """Отмечает запуск как неудачный, если ошибка обработана и не выходит за пределы run_report"""
+        with self.lock:
+            self.error = str(error)
+
+    def snapshot(self) -> dict:
+        """Замеры в виде, пригодном для передачи между процессами (см. merge)"""
+        with self.lock:
+            return dict(timers={name: list(timer) for name, timer in self.timers.items()},
+                        counters=dict(self.counters),
+                        histograms={name: (bounds, list(counts)) for name, (bounds, counts) in self.histograms.items()})
+
+    def merge(self, snapshot: dict):
+        """Добавляет замеры, сделанные в другом процессе"""
+        with self.lock:
+            for name, (count, total, peak) in snapshot['timers'].items():
+                timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+                timer[0] += count
+                timer[1] += total
+                timer[2] = max(timer[2], peak)
+            for name, value in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, (bounds, counts) in snapshot['histograms'].items():
+                _, total = self.histograms.setdefault(name, (bounds, [0] * len(counts)))
+                for i, count in enumerate(counts):
+                    total[i] += count
+
+    def report(self) -> dict:
+        """Отчёт о запуске в виде, пригодном для сохранения в JSON"""
+        with self.lock:
+            return dict(
+                started_at=strftime('%Y-%m-%dT%H:%M:%S', localtime(self.started_at)),
+                seconds=round(time() - self.started_at, 3),
+                timers={name: dict(count=count, seconds=round(total, 6), max=round(peak, 6),
+                                   avg=round(total / count, 6) if count else 0.0)
+                        for name, (count, total, peak) in sorted(self.timers.items())},
+                counters=dict(sorted(self.counters.items())),
+                histograms={name: dict(zip([f'<={bound}' for bound in bounds] + [f'>{bounds[-1]}'], counts))
+                            for name, (bounds, counts) in sorted(self.histograms.items())})
+
+
+metrics = Metrics()
+
+
+def collected(func: Callable, *args, **kwargs) -> Tuple[Any, dict]:
+    """Выполняет func в дочернем процессе пула и возвращает её результат вместе с замерами,
+       чтобы родительский процесс добавил их в свой отчёт через metrics.merge"""
+    metrics.reset()  # при fork дочерний процесс наследует замеры родителя
+    result = func(*args, **kwargs)
+    return result, metrics.snapshot()
+
+
+_runs = 0  # количество выполняющихся run_report
+_runs_lock = Lock()
+_report: dict = {}  # общий отчёт выполняющихся запусков: имя, путь, профилировщик, была ли ошибка
+
+
+@contextmanager
+def run_report(name: str, report_dir: 'str | None' = None) -> Iterator[Metrics]:
+    """Запуск с отчётом: метрики сохраняются в <report_dir>/<name>-<время>.json
+       (каталог - METRICS_DIR, по умолчанию reports), когда завершается последний
+       из выполняющихся запусков, в т.ч. с ошибкой. Вложенные и параллельные запуски
+       попадают в один отчёт, имя и время которого - от первого из них.
+       Если задана переменная окружения PROFILE, поток первого запуска профилируется cProfile
+       и статистика сохраняется рядом с отчётом в <name>-<время>.prof"""
+    global _runs
+    profiler = None
+    with _runs_lock:
+        if _runs == 0:
+            metrics.reset()
+            _report.clear()
+            _report.update(name=name, stem=report_stem(name, report_dir), failed=False, profiler=None)
+            if os.environ.get('PROFILE'):
+                import cProfile
+                profiler = _report['profiler'] = cProfile.Profile()
+        _runs += 1
+    if profiler is not None:
+        profiler.enable()
+    failed = True
+    try:
+        yield metrics
+        failed = False
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        with _runs_lock:
+            _runs -= 1
+            _report['failed'] |= failed
+            if _runs == 0:
+                _save_run_report()
+
+
+def _save_run_report():
+    """Сохраняет общий отчёт запусков (вызывается под _runs_lock последним завершившимся запуском)"""
+    failed = _report['failed'] or metrics.error is not None
+    report = dict(name=_report['name'], status='failed' if failed else 'ok', **metrics.report())
+    if metrics.error is not None:
+        report['error'] = metrics.error
+    stem, profiler = _report['stem'], _report['profiler']
+    if profiler is not None:
+        profiler.dump_stats(stem.with_suffix('.prof'))
+        report['profile'] = str(stem.with_suffix('.prof'))
+    save_report(stem, report)
+
+
+def report_stem(name: str, report_dir: 'str | None' = None) -> Path:
+    """Путь отчёта без расширения: <report_dir>/<name>-<время>, каталог создаётся"""
+    path = Path(report_dir or os.environ.get('METRICS_DIR', 'reports'))
+    path.mkdir(parents=True, exist_ok=True)
+    now = time()
+    return path / f'{name}-{strftime("%Y%m%d-%H%M%S", localtime(now))}-{int(now * 1000) % 1000:03}'
+
+
+def save_report(stem: Path, report: 'dict | list') -> Path:
+    """Сохраняет отчёт в <stem>.json"""
+    path = stem.with_suffix('.json')
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    return path
+
+
+def peak_rss_mb() -> 'float | None':
+    """Пиковый объём резидентной памяти процесса, МБ (с учётом завершённых дочерних процессов).
+       None, если платформа не поддерживает модуль resource"""
+    if resource is None:
+        return None
+    scale = 2 ** 20 if sys.platform == 'darwin' else 2 ** 10  # ru_maxrss: байты на macOS, КБ на Linux
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak / scale, 1)
+
+
+def _measured(func: Callable, args: tuple, kwargs: dict) -> dict:
+    start = perf_counter()
+    result = func(*args, **kwargs)
+    return dict(result=result, seconds=round(perf_counter() - start, 3), peak_rss_mb=peak_rss_mb())
+
+
+def measure(func: Callable, *args, **kwargs) -> dict:
+    """Выполняет func в отдельном процессе, чтобы замеры памяти не зависели от предыдущих запусков.
+       Возвращает результат func, время выполнения и пиковую память процесса.
+       func и её аргументы должны передаваться между процессами (функция уровня модуля)"""
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(_measured, func, args, kwargs).result()
@@ -0,0 +1,228 @@
+# Общий модуль hw1 и hw2. Задания запускаются каждое из своего каталога и не являются пакетами,
+# поэтому их модули добавляют каталог common в sys.path
+import json
+import os
+import pandas as pd
+from pathlib import Path
+from threading import RLock
+from time import strftime
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple
+from urllib.parse import quote
+from metrics import metrics
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def import_pyarrow():
+    """pyarrow - необязательная зависимость, нужна только для Parquet и импортируется при первом обращении"""
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet requires pyarrow: pip install pyarrow') from None
+    return pyarrow
+
+
+def arrow_type(dtype: str) -> 'pa.DataType':
+    """Тип Arrow по краткому названию: int64, float64, bool, string, category, datetime"""
+    pa = import_pyarrow()
+    return dict(int64=pa.int64(), float64=pa.float64(), bool=pa.bool_(), string=pa.string(),
+                category=pa.dictionary(pa.int32(), pa.string()),
+                datetime=pa.timestamp('us', tz='UTC'))[dtype]
+
+
+def to_arrow(df: pd.DataFrame, schema: 'pa.Schema') -> 'pa.Table':
+    """Приводит DF к компактной схеме: числа и даты типизируются, категории кодируются словарём"""
+    pa = import_pyarrow()
+    arrays = []
+    for field in schema:
+        values = df[field.name] if field.name in df else pd.Series([None] * len(df), index=df.index, dtype=object)
+        if pa.types.is_dictionary(field.type):
+            array = pa.array(values.astype('string'), type=pa.string(), from_pandas=True).dictionary_encode()
+        elif pa.types.is_timestamp(field.type):
+            array = pa.array(pd.to_datetime(values, utc=True), from_pandas=True)
+        elif pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            array = pa.array(pd.to_numeric(values, errors='coerce'), from_pandas=True)
+        elif pa.types.is_boolean(field.type):
+            array = pa.array(values.astype('boolean'), from_pandas=True)
+        else:
+            array = pa.array(values.astype('string'), type=pa.string(), from_pandas=True)
+        arrays.append(array.cast(field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class ParquetSink:
+    """Приёмник результатов в секционированный Parquet - альтернатива записи в SQLite.
+       Файлы раскладываются по секциям в стиле Hive: <root>/<partition_by>=<значение>/part-*.parquet,
+       значение секции берётся из столбца partition_by или вычисляется partition_key(df).
+       В файлы попадают столбцы dtypes с заданными типами (см. arrow_type).
+       DF дописываются потоково: строки копятся по секциям и пишутся группами по row_group_rows,
+       файл закрывается и становится видимым после file_rows строк, при flush или close.
+       Файл архива, из которого получен DF, отмечается в журнале <root>/_ledger.jsonl,
+       как только закрыты все файлы с его строками (интерфейс как у SQLiteWriter).
+       replaced(df, member, key) - строки прежней загрузки файла архива: при put с replace=True
+       они удаляются из закрытых файлов до записи новых строк.
+       В каталог root пишет один процесс: незакрытые файлы прерванных запусков удаляются при открытии"""
+
+    def __init__(self, root: 'str | Path', dtypes: Dict[str, str], partition_by: 'str | None' = None,
+                 partition_key: 'Callable[[pd.DataFrame], pd.Series] | None' = None, *,
+                 replaced: 'Callable[[pd.DataFrame, str, str | None], pd.Series] | None' = None,
+                 row_group_rows: int = 65536, file_rows: int = 1_000_000, compression: str = 'zstd'):
+        pa = import_pyarrow()
+        self.root = Path(root)
+        self.partition_by = partition_by
+        self.partition_key = partition_key
+        self.replaced = replaced
+        self.schema = pa.schema([(name, arrow_type(dtype)) for name, dtype in dtypes.items()
+                                 if name != partition_by])
+        self.row_group_rows = row_group_rows
+        self.file_rows = file_rows
+        self.compression = compression
+        self.prefix = f'part-{strftime("%Y%m%d-%H%M%S")}-{os.getpid()}'
+        self.lock = RLock()  # put и flush могут вызываться из нескольких process_df
+        self.buffers: Dict[str, List[pd.DataFrame]] = {}  # секция -> DF, ещё не записанные в файл
+        self.writers: Dict[str, list] = {}  # секция -> [ParquetWriter, временный путь, строк в файле]
+        self.files = 0
+        self.rows = 0
+        self.members: List[list] = []  # [файл архива, ключ, CRC, строк, секции с его строками в незакрытых файлах]
+        self.root.mkdir(parents=True, exist_ok=True)
+        for path in self.root.rglob('.part-*.parquet'):
+            path.unlink()
+
+    def put(self, df: pd.DataFrame, member: 'str | None' = None, crc: 'int | None' = None,
+            key: 'str | None' = None, replace: bool = False):
+        """Дописывает DF. member, crc и key - файл архива, из которого получен DF, и ключ его загрузки
+           для журнала. replace - сначала удалить строки прежней загрузки файла (см. replaced)"""
+        with self.lock:
+            if replace:
+                if self.replaced is None:
+                    raise ValueError('replace requires the replaced rows selector')
+                self.delete(lambda part: self.replaced(part, member, key))
+            partitions = set()
+            if len(df):
+                if self.partition_by is None:
+                    groups = [('', df)]
+                else:
+                    keys = self.partition_key(df) if self.partition_key else df[self.partition_by]
+                    groups = df.groupby(keys.fillna(NULL_PARTITION).astype(str), sort=False)
+                for partition, part in groups:
+                    partitions.add(partition)
+                    self.buffers.setdefault(partition, []).append(part)
+                self.rows += len(df)
+            if member is not None:
+                self.members.append([member, key, crc, len(df), partitions])
+            for partition in list(partitions):
+                if sum(map(len, self.buffers.get(partition, []))) >= self.row_group_rows:
+                    self._write(partition)
+            self._write_ledger()
+
+    def _write(self, partition: str):
+        """Записывает накопленные строки секции группой строк, закрывает файл по достижении file_rows"""
+        buffer = self.buffers.pop(partition, [])
+        if not buffer:
+            return
+        pq = import_pyarrow().parquet
+        with metrics.timer('parquet.write'):
+            table = to_arrow(pd.concat(buffer, ignore_index=True), self.schema)
+            if partition not in self.writers:
+                directory = self.root / f'{self.partition_by}={quote(partition, safe="")}' \
+                    if self.partition_by is not None else self.root
+                directory.mkdir(parents=True, exist_ok=True)
+                # Пока файл пишется, он скрыт от чтения (файлы на "." и "_" не читаются)
+                path = directory / f'.{self.prefix}-{self.files:05}.parquet'
+                self.files += 1
+                self.writers[partition] = [pq.ParquetWriter(path, self.schema, compression=self.compression),
+                                           path, 0]
+            writer = self.writers[partition]
+            writer[0].write_table(table, row_group_size=self.row_group_rows)
+            writer[2] += len(table)
+            if writer[2] >= self.file_rows:
+                self._close_file(partition)
+
+    def _close_file(self, partition: str):
+        """Закрывает файл секции и делает его видимым для чтения.
+           Все записанные строки секции теперь в закрытых файлах (буфер секции пуст)"""
+        writer, path, _ = self.writers.pop(partition)
+        writer.close()
+        path.rename(path.with_name(path.name[1:]))
+        for entry in self.members:
+            entry[-1].discard(partition)
+
+    def _write_ledger(self):
+        """Отмечает в журнале файлы архива, все строки которых уже в закрытых файлах"""
+        done = [entry for entry in self.members if not entry[-1]]
+        if not done:
+            return
+        with open(self.root / '_ledger.jsonl', 'a', encoding='utf-8') as ledger:
+            for member, key, crc, rows, _ in done:
+                print(json.dumps(dict(member=member, key=key, crc=crc, rows=rows), ensure_ascii=False), file=ledger)
+        self.members = [entry for entry in self.members if entry[-1]]
+
+    def flush(self):
+        """Дописывает остатки, закрывает файлы и отмечает файлы архива в журнале.
+           Последующие DF пишутся в новые файлы"""
+        with self.lock:
+            for partition in list(self.buffers):
+                self._write(partition)
+            for partition in list(self.writers):
+                self._close_file(partition)
+            self._write_ledger()
+
+    def delete(self, mask: Callable[[pd.DataFrame], pd.Series]) -> int:
+        """Удаляет из закрытых файлов строки, для которых mask(df) истинна: такие файлы переписываются.
+           Возвращает количество удалённых строк"""
+        pa = import_pyarrow()
+        deleted = 0
+        with self.lock, metrics.timer('parquet.delete'):
+            for path in sorted(self.root.rglob('part-*.parquet')):
+                table = pa.parquet.ParquetFile(path).read()
+                drop = mask(table.to_pandas()).to_numpy(dtype=bool)
+                if not drop.any():
+                    continue
+                deleted += int(drop.sum())
+                if drop.all():
+                    path.unlink()
+                    continue
+                hidden = path.with_name('.' + path.name)
+                pa.parquet.write_table(table.filter(pa.array(~drop)), hidden, compression=self.compression,
+                                       row_group_size=self.row_group_rows)
+                os.replace(hidden, path)
+        metrics.count('parquet.deleted_rows', deleted)
+        return deleted
+
+    def close(self) -> dict:
+        """Дописывает остатки и закрывает файлы, возвращает статистику"""
+        self.flush()
+        metrics.count('parquet.rows', self.rows)
+        return dict(rows=self.rows, files=self.files)
+
+    def loaded(self) -> Dict[Tuple[str, 'str | None'], int]:
+        """Файлы архива, отмеченные в журнале: {(имя файла, ключ загрузки): CRC}"""
+        path = self.root / '_ledger.jsonl'
+        if not path.exists():
+            return {}
+        with open(path, encoding='utf-8') as ledger:
+            return {(entry['member'], entry.get('key')): entry['crc'] for entry in map(json.loads, ledger)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_parquet(root: 'str | Path', columns: 'List[str] | None' = None, filters=None) -> pd.DataFrame:
+    """Читает секционированный Parquet в DF без разбора текста: файлы отображаются в память,
+       словарные столбцы и секции становятся категориями. filters - фильтр pyarrow
+       по столбцам и секциям, например [('okved_prefix', '=', '61')]"""
+    pa = import_pyarrow()
+    # Значения секций - строки, а не числа, которые pyarrow вывел бы сам
+    keys = sorted({path.name.split('=', 1)[0] for path in Path(root).iterdir() if '=' in path.name})
+    partitioning = pa.dataset.partitioning(pa.schema([(key, pa.string()) for key in keys]), flavor='hive')
+    df = pa.parquet.read_table(root, columns=columns, filters=filters, memory_map=True,
+                               partitioning=partitioning).to_pandas()
+    return df.astype({key: 'category' for key in keys if key in df})
@@ -0,0 +1,180 @@
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import zipfile
+from contextlib import closing
+from pathlib import Path
+from time import perf_counter
+from typing import List
+
+import pandas as pd
+
+import multiprocutils as mpu
+import process
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'common'))  # общие модули hw1 и hw2: metrics, parquet_sink
+from metrics import measure, report_stem, save_report
+
+
+OKVED_CODES = ['61.10', '61.20', '61.30', '61.90', '62.01', '63.11', '47.11', '41.20', '68.20', '70.22']
+
+
+REGIONS = ['77', '78', '50', '23', '54']
+
+
+def make_okved(code: str, name: str) -> dict:
+    return {'КодОКВЭД': code, 'НаимОКВЭД': name, 'ПрВерсОКВЭД': '2014'}
+
+
+def make_record(i: int) -> dict:
+    """Создаёт одну синтетическую запись ЕГРЮЛ со вложенной структурой, близкой к реальной:
+       у части записей нет сведений об ОКВЭД, дополнительный ОКВЭД бывает одиночным объектом"""
+    code = random.choice(OKVED_CODES)
+    region = random.choice(REGIONS)
+    data = {'ИНН': str(7700000000 + i),
+            'ОГРН': str(1000000000000 + i),
+            'ДатаВып': '2023-01-10',
+            'СвНаимЮЛ': {'НаимЮЛПолн': f'ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ "КОМПАНИЯ {i}"',
+                         'СвНаимЮЛСокр': {'НаимСокр': f'ООО "КОМПАНИЯ {i}"'}},
+            'СвАдресЮЛ': {'СвМНЮЛ': {'КодРегион': region,
+                                     'НаимРегион': f'Регион {region}',
+                                     'НаселенПункт': {'ВидНаселПункт': 'Г.', 'НаимНаселПункт': 'ГОРОД'}}},
+            'СвУчредит': {'УчрФЛ': [{'СвФЛ': {'Фамилия': f'ИВАНОВ{j}', 'Имя': 'ИВАН', 'Отчество': 'ИВАНОВИЧ'},
+                                     'ДоляУстКап': {'НоминСтоим': str(10000 * (j + 1))}}
+                                    for j in range(random.randint(1, 3))]}}
+    if random.random() < 0.95:  # у части записей сведений об ОКВЭД нет
+        extra = [make_okved(random.choice(OKVED_CODES), 'Дополнительная деятельность')
+                 for _ in range(random.randint(1, 6))]
+        data['СвОКВЭД'] = {'СвОКВЭДОсн': make_okved(code, f'Деятельность {code}'),
+                           'СвОКВЭДДоп': extra if len(extra) > 1 else extra[0]}
+    return dict(ogrn=1000000000000 + i,
+                inn=7700000000 + i,
+                kpp=770001001,
+                name=f'ООО "Компания {i}"',
+                full_name=f'ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ "КОМПАНИЯ {i}"',
+                data=data)
+
+
+def make_archive(path: 'str | Path', members: int, records: int = 1000, seed: int = 0,
+                 size_mb: 'float | None' = None) -> List[str]:
+    """Создаёт синтетический zip-архив ЕГРЮЛ из members файлов по records записей.
+       Если задан size_mb, количество записей подбирается так, чтобы распакованный
+       объём архива был около size_mb МБ"""
+    random.seed(seed)
+    if size_mb is not None:
+        record_size = len(json.dumps(make_record(0), ensure_ascii=False).encode('utf-8')) + 2
+        records = max(1, int(size_mb * 2 ** 20 / record_size / members))
+    files = []
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zipobj:
+        for m in range(members):
+            file = f'{m + 1}.json'
+            data = [make_record(m * records + i) for i in range(records)]
+            zipobj.writestr(file, json.dumps(data, ensure_ascii=False))
+            files.append(file)
+    return files
+
+
+def make_batch(records: int, seed: int = 0) -> pd.DataFrame:
+    """Создаёт синтетический DF ЕГРЮЛ в том виде, в котором его возвращает pd.read_json"""
+    random.seed(seed)
+    return pd.DataFrame([make_record(i) for i in range(records)])
+
+
+def processor_df_apply(df: pd.DataFrame) -> pd.DataFrame:
+    """Прежняя построчная реализация processor_df (для сравнения)"""
+    df = df.assign(data=df.data.apply(mpu.parser_data))
+    df = df[df.data.notna()]
+    return df[mpu.COLS].join(df.data.apply(pd.Series))
+
+
+def bench_processor_df(records: int = 1_000_000) -> dict:
+    """Сравнивает построчную и векторную фильтрацию по ОКВЭД на одном батче"""
+    df = make_batch(records)
+    timings = {}
+    results = {}
+    for name, func in (('apply', processor_df_apply), ('vectorized', mpu.processor_df)):
+        start = perf_counter()
+        results[name] = func(df)
+        timings[name] = perf_counter() - start
+        print(f'{name}: {timings[name]:.2f} с, строк: {len(results[name])}')
+    pd.testing.assert_frame_equal(results['apply'], results['vectorized'])
+    print(f'ускорение: {timings["apply"] / timings["vectorized"]:.1f}x')
+    return timings
+
+
+def bench_mulitproc_zip(path: 'str | Path', files: List[str], nprocs=(1, 2, 4, 8)) -> dict:
+    """Замеряет время mulitproc_zip для разного количества процессов"""
+    timings = {}
+    for nproc in nprocs:
+        start = perf_counter()
+        dfs = mpu.mulitproc_zip(path, files, nproc)
+        timings[nproc] = perf_counter() - start
+        rows = sum(len(df) for df in dfs)
+        print(f'nproc={nproc}: {timings[nproc]:.2f} с, строк: {rows}, '
+              f'ускорение: {timings[nprocs[0]] / timings[nproc]:.2f}x')
+    return timings
+
+
+def load_process_df(path: str, files: List[str], batch_size: int, stream: bool = False) -> int:
+    """Загрузчик process.process_df: пул потоков и писатель в БД (во временном каталоге)"""
+    path = os.path.abspath(path)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        result = process.process_df(path, files, batch_size, stream)
+        assert result == 0, result
+        with closing(sqlite3.connect('hw1.db')) as connection:
+            return connection.execute('select count(*) from telecom_companiesokved').fetchone()[0]
+
+
+def load_unpacker(path: str, files: List[str], nproc: int, stream: bool = False) -> int:
+    """Загрузчик multiprocutils.unpacker + mulitproc (без записи в БД)"""
+    dfs = mpu.unpacker(path, files, nproc, stream)
+    if not stream:
+        dfs = mpu.mulitproc(dfs, nproc, 1)
+    return sum(len(df) for df in dfs)
+
+
+def load_mulitproc_zip(path: str, files: List[str], nproc: int, stream: bool = False) -> int:
+    """Загрузчик multiprocutils.mulitproc_zip: пул процессов (без записи в БД)"""
+    return sum(len(df) for df in mpu.mulitproc_zip(path, files, nproc, stream=stream))
+
+
+LOADERS = {'process_df': load_process_df, 'unpacker': load_unpacker, 'mulitproc_zip': load_mulitproc_zip}
+
+
+def bench_loaders(path: 'str | Path', files: List[str], workers=(1, 4), streams=(False, True)) -> List[dict]:
+    """Сравнивает загрузчики архива: время, пропускную способность и пиковую память.
+       Каждая конфигурация выполняется в отдельном процессе, результаты сохраняются в reports"""
+    with zipfile.ZipFile(path, 'r') as zipobj:
+        size_mb = sum(zipobj.getinfo(file).file_size for file in files) / 2 ** 20
+    results = []
+    for name, loader in LOADERS.items():
+        for nproc in workers:
+            for stream in streams:
+                run = measure(loader, str(path), files, nproc, stream)
+                results.append(dict(loader=name, workers=nproc, stream=stream, rows=run['result'],
+                                    seconds=run['seconds'], mb_per_sec=round(size_mb / run['seconds'], 2),
+                                    peak_rss_mb=run['peak_rss_mb']))
+                print(f'{name:<14} workers={nproc} stream={stream!s:<5} {run["seconds"]:7.2f} с, '
+                      f'{size_mb / run["seconds"]:6.1f} МБ/с, пик памяти {run["peak_rss_mb"]} МБ, '
+                      f'строк: {run["result"]}')
+    assert len({result['rows'] for result in results}) == 1, 'загрузчики вернули разное количество строк'
+    print('Результаты:', save_report(report_stem('bench-hw1'), dict(archive=str(path), size_mb=round(size_mb, 1),
+                                                                     files=len(files), results=results)))
+    return results
+
+
+if __name__ == '__main__':
+    archive = Path(os.environ.get('BENCH_ARCHIVE', 'bench_egrul.json.zip'))
+    if not archive.exists():
+        size_mb = os.environ.get('BENCH_MB')
+        make_archive(archive, members=int(os.environ.get('BENCH_MEMBERS', 32)),
+                     records=int(os.environ.get('BENCH_RECORDS', 5000)),
+                     size_mb=float(size_mb) if size_mb else None)
+    with zipfile.ZipFile(archive, 'r') as zipobj:
+        files = zipobj.namelist()
+    bench_loaders(archive, files)
+    bench_mulitproc_zip(archive, files)
+    bench_processor_df(int(os.environ.get('BENCH_BATCH', 1_000_000)))
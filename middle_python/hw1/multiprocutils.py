@@ -1,60 +1,207 @@
+import io
+import json
+import sys
 import zipfile
 # import sqlite3
 import pandas as pd
 from tqdm import tqdm
 from multiprocessing.pool import ThreadPool as Pool
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Iterable
+from multiprocessing import Pool as ProcessPool
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+from typing import Any, Callable, List, Iterable, Iterator, IO, Tuple
 from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'common'))  # общие модули hw1 и hw2: metrics, parquet_sink
+from metrics import collected, metrics
 
 
-def unpacker(path: 'str | Path', files: List[str], max_workers: int) -> pd.DataFrame:
-    """Распаковщик данных из zip-архива и парсер JSON"""
+COLS = ['ogrn', 'inn', 'kpp', 'name', 'full_name']
+OKVED_COLS = ['code_okved', 'name_okved', 'type_okved']
+OKVED_PREFIXES = ('61',)  # фильтр по умолчанию - телекоммуникации
 
-    def parser_json(json_file: str) -> pd.DataFrame:
-        """Парсит один файл JSON"""
-        with zipobj.open(json_file) as file:
-            return pd.read_json(file)
 
+def pipeline(path: 'str | Path', files: List[str], func: Callable[[zipfile.ZipFile, str], Any],
+             max_workers: int, max_bytes: 'int | None' = None) -> Iterator[Tuple[str, Future]]:
+    """Конвейерная обработка файлов zip-архива в пуле потоков.
+       В обработке одновременно находится не более max_workers файлов
+       и не более max_bytes распакованных байт (по ZipInfo.file_size, хотя бы один файл всегда).
+       Результаты отдаются по мере готовности, а освободившееся место
+       сразу занимается следующим файлом"""
     with zipfile.ZipFile(path, 'r') as zipobj:
+        queue = deque(zipobj.getinfo(file) for file in files)
+        in_flight = {}  # future -> ZipInfo
+        in_bytes = 0
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # загружаем и отмечаем каждый будущий результат своим файлом
-            future_to_file = {executor.submit(parser_json, file): file for file in files}
-            for future in tqdm(as_completed(future_to_file)):
-                file = future_to_file[future]
-                try:
-                    # data = parser_json(file)
-                    data = future.result()
-                except Exception as exc:
-                    print(f'{file} сгенерировано исключение: {exc}')
-                else:
-                    yield data
-
-
-def parser_data(value: dict) -> pd.DataFrame:
+            while queue or in_flight:
+                # Дозаполняем окно, пока есть место по количеству файлов и по объёму
+                while queue and len(in_flight) < max_workers and \
+                        (not in_flight or max_bytes is None or in_bytes + queue[0].file_size <= max_bytes):
+                    info = queue.popleft()
+                    in_flight[executor.submit(func, zipobj, info.filename)] = info
+                    in_bytes += info.file_size
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    info = in_flight.pop(future)
+                    in_bytes -= info.file_size
+                    metrics.count('zip.files')
+                    metrics.count('zip.bytes', info.file_size)
+                    metrics.count('zip.compressed_bytes', info.compress_size)
+                    yield info.filename, future
+
+
+def read_json_member(zipobj: zipfile.ZipFile, json_file: str) -> pd.DataFrame:
+    """Распаковывает и парсит файл JSON из архива (время распаковки и парсинга учитывается раздельно)"""
+    with metrics.timer('zip.read'), zipobj.open(json_file) as file:
+        data = file.read()
+    with metrics.timer('json.parse'):
+        return pd.read_json(io.BytesIO(data))
+
+
+def unpacker(path: 'str | Path', files: List[str], max_workers: int, stream: bool = False,
+             prefixes: Iterable[str] = OKVED_PREFIXES, max_bytes: 'int | None' = None) -> pd.DataFrame:
+    """Распаковщик данных из zip-архива и парсер JSON.
+       При stream=True файлы читаются потоково и возвращаются
+       уже отфильтрованные по ОКВЭД DF (processor_df не нужен)"""
+
+    def parser_json(zipobj: zipfile.ZipFile, json_file: str) -> pd.DataFrame:
+        """Парсит один файл JSON"""
+        if not stream:
+            return read_json_member(zipobj, json_file)
+        with zipobj.open(json_file) as file:
+            return parser_stream(file, prefixes)
+
+    for file, future in tqdm(pipeline(path, files, parser_json, max_workers, max_bytes), total=len(files)):
+        try:
+            data = future.result()
+        except Exception as exc:
+            print(f'{file} сгенерировано исключение: {exc}')
+        else:
+            yield data
+
+
+def parser_data(value: dict, prefixes: Iterable[str] = OKVED_PREFIXES) -> dict:
     """Парсер атрибута data"""
     # Получаем значения КодОКВЭД и НаимОКВЭД. Если нет, устанавливаем значения в None
     main_val = dict(code_okved=value.get('СвОКВЭД', {}).get('СвОКВЭДОсн', {}).get('КодОКВЭД'),
                     name_okved=value.get('СвОКВЭД', {}).get('СвОКВЭДОсн', {}).get('НаимОКВЭД'),
                     type_okved='Осн')
-    # Фильтруем по 61 ОКВЭД
+    # Фильтруем по заданным ОКВЭД
     code = main_val['code_okved']
-    return main_val if code and code.startswith('61') else None
+    return main_val if code and code.startswith(tuple(prefixes)) else None
+
+
+def iter_json_positions(file: IO[bytes], chunk_size: int = 1 << 16) -> Iterator[Tuple[int, dict]]:
+    """Потоково читает JSON-массив и возвращает записи по одной вместе с их смещением
+       (в символах от начала файла), не загружая файл в память целиком"""
+    decoder = json.JSONDecoder()
+    text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+    buf, pos, base, eof = '', 0, 0, False  # base - смещение начала buf в файле
+    while True:
+        # Пропускаем начало массива, разделители и пробелы между записями
+        while pos < len(buf) and buf[pos] in '[, \t\r\n':
+            pos += 1
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # Запись не поместилась в буфер - дочитываем следующий фрагмент
+            if eof:
+                if buf[pos:].strip():
+                    raise
+                return
+            chunk = text.read(chunk_size)
+            eof = not chunk
+            buf, base, pos = buf[pos:] + chunk, base + pos, 0
+        else:
+            yield base + pos, record
+            pos = end
 
 
-def processor_df(df: pd.DataFrame) -> pd.DataFrame:
-    """Парсер и обработчик данных"""
-    # Парсим атрибут data и записываем данные в общий DF
-    df = df.assign(data=df.data.apply(parser_data))
-    # Исключаем пустые данные (т.е. те, что не попали под ОКВЭД 61)
-    df = df[df.data.notna()]
-    # Разбиваем атрибут data на столбцы, и добавляем их в общий DF
-    cols = ['ogrn', 'inn', 'kpp', 'name', 'full_name']
-    return df[cols].join(df.data.apply(pd.Series))
+def iter_json_records(file: IO[bytes], chunk_size: int = 1 << 16) -> Iterator[dict]:
+    """Потоково читает JSON-массив и возвращает записи по одной,
+       не загружая файл в память целиком"""
+    for _, record in iter_json_positions(file, chunk_size):
+        yield record
 
 
-def mulitproc(iterable: Iterable, nproc: int, chunksize: int):
+def parser_records(records: Iterable[dict], prefixes: Iterable[str] = OKVED_PREFIXES) -> Iterator[dict]:
+    """Фильтрует записи по ОКВЭД и формирует строки только для подходящих"""
+    prefixes = tuple(prefixes)
+    for record in records:
+        okved = parser_data(record.get('data') or {}, prefixes)
+        if okved is None:
+            continue
+        row = {col: record.get(col) for col in COLS}
+        row.update(okved)
+        yield row
+
+
+def parser_stream(file: IO[bytes], prefixes: Iterable[str] = OKVED_PREFIXES) -> pd.DataFrame:
+    """Потоковый парсер файла JSON: в DF попадают только записи, прошедшие фильтр"""
+    with metrics.timer('parser_stream'):
+        df = pd.DataFrame(list(parser_records(iter_json_records(file), prefixes)), columns=COLS + OKVED_COLS)
+    metrics.count('parser_stream.rows_out', len(df))
+    return df
+
+
+def processor_df(df: pd.DataFrame, prefixes: Iterable[str] = OKVED_PREFIXES) -> pd.DataFrame:
+    """Парсер и обработчик данных.
+       Атрибуты ОКВЭД извлекаются сразу для всего столбца data,
+       фильтр по префиксам ОКВЭД векторный"""
+    if 'data' not in df:
+        return pd.DataFrame(columns=COLS + OKVED_COLS)
+    with metrics.timer('processor_df'):
+        # Достаём основной ОКВЭД сразу по всему столбцу
+        okved = df.data.str.get('СвОКВЭД').str.get('СвОКВЭДОсн')
+        codes = okved.str.get('КодОКВЭД')
+        # Оставляем только записи с заданными ОКВЭД
+        mask = codes.str.startswith(tuple(prefixes), na=False)
+        okved = okved[mask]
+        result = df.loc[mask, COLS].assign(code_okved=codes[mask],
+                                           name_okved=okved.str.get('НаимОКВЭД'),
+                                           type_okved='Осн').infer_objects()
+    metrics.count('processor_df.rows_in', len(df))
+    metrics.count('processor_df.rows_out', len(result))
+    return result
+
+
+def mulitproc(iterable: Iterable, nproc: int, chunksize: int, prefixes: Iterable[str] = OKVED_PREFIXES):
     """Парсит данные из JSON файлов в DF в параллельном режиме"""
     with Pool(processes=nproc) as process_pool:
-        dfs = process_pool.map(processor_df, iterable, chunksize)
+        dfs = process_pool.map(partial(processor_df, prefixes=prefixes), iterable, chunksize)
+    return dfs
+
+
+def splitter(files: List[str], chunksize: int) -> List[List[str]]:
+    """Разбивает список файлов на фрагменты по chunksize файлов"""
+    return [files[i:i + chunksize] for i in range(0, len(files), chunksize)]
+
+
+def processor_files(path: 'str | Path', files: List[str], stream: bool = False,
+                    prefixes: Iterable[str] = OKVED_PREFIXES) -> pd.DataFrame:
+    """Распаковывает, парсит и фильтрует заданные файлы архива.
+       Вызывается в дочернем процессе: архив открывается внутри процесса,
+       обратно передаётся только отфильтрованный по ОКВЭД DF"""
+    dfs = []
+    with zipfile.ZipFile(path, 'r') as zipobj:
+        for file in files:
+            with zipobj.open(file) as json_file:
+                dfs.append(parser_stream(json_file, prefixes) if stream
+                           else processor_df(pd.read_json(json_file), prefixes))
+    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+
+
+def mulitproc_zip(path: 'str | Path', files: List[str], nproc: int, chunksize: int = 1,
+                  stream: bool = False, prefixes: Iterable[str] = OKVED_PREFIXES) -> List[pd.DataFrame]:
+    """Парсит файлы zip-архива в пуле процессов.
+       Каждый процесс сам читает свою часть файлов из архива,
+       поэтому исходные DF не передаются между процессами"""
+    worker = partial(collected, processor_files, path, stream=stream, prefixes=tuple(prefixes))
+    dfs = []
+    with ProcessPool(processes=nproc) as process_pool:
+        for df, snapshot in tqdm(process_pool.imap_unordered(worker, splitter(files, chunksize))):
+            metrics.merge(snapshot)  # замеры дочерних процессов - в отчёт запуска
+            dfs.append(df)
     return dfs
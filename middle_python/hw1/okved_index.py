@@ -0,0 +1,181 @@
+import json
+import sqlite3
+import sys
+import zipfile
+import pandas as pd
+from collections import defaultdict
+from functools import partial
+from multiprocessing import Pool as ProcessPool
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'common'))  # общие модули hw1 и hw2: metrics, parquet_sink
+from metrics import collected, metrics
+from multiprocutils import COLS, OKVED_COLS, OKVED_PREFIXES, iter_json_positions, pipeline
+
+
+SCHEMA = """
+create table if not exists members(
+    id integer primary key,
+    member text unique,
+    crc integer,
+    records integer
+);
+create table if not exists okved(
+    code text,
+    member_id integer,
+    offset integer,
+    main boolean,
+    primary key(code, member_id, offset, main)
+) without rowid
+"""
+
+
+def record_codes(record: dict) -> Iterator[Tuple[str, str, bool]]:
+    """Коды ОКВЭД записи: (код, наименование, признак основного)"""
+    okved = (record.get('data') or {}).get('СвОКВЭД') or {}
+    main = okved.get('СвОКВЭДОсн') or {}
+    if main.get('КодОКВЭД'):
+        yield main['КодОКВЭД'], main.get('НаимОКВЭД'), True
+    extra = okved.get('СвОКВЭДДоп') or []
+    # Единственный дополнительный ОКВЭД записан объектом, а не списком
+    for item in [extra] if isinstance(extra, dict) else extra:
+        if item.get('КодОКВЭД'):
+            yield item['КодОКВЭД'], item.get('НаимОКВЭД'), False
+
+
+def index_member(path: 'str | Path', member: str) -> Tuple[str, int, List[Tuple[str, int, bool]]]:
+    """Индексирует один файл архива: (файл, количество записей, [(код, смещение записи, основной)]).
+       Вызывается в дочернем процессе"""
+    entries = []
+    records = 0
+    with metrics.timer('index.member'), zipfile.ZipFile(path, 'r') as zipobj, zipobj.open(member) as file:
+        for offset, record in iter_json_positions(file):
+            records += 1
+            entries.extend({(code, offset, main) for code, _, main in record_codes(record)})
+    return member, records, entries
+
+
+class OkvedIndex:
+    """Индекс ОКВЭД архива ЕГРЮЛ в SQLite рядом с архивом (<архив>.okved.db).
+       Для каждого основного и дополнительного кода ОКВЭД хранит файл архива
+       и смещение записи в нём, для файлов - CRC, по которому обнаруживается устаревший индекс.
+       Выборка по любым префиксам ОКВЭД читает только файлы с подходящими записями
+       и разбирает только эти записи"""
+
+    def __init__(self, path: 'str | Path', index_path: 'str | Path | None' = None):
+        self.path = Path(path)
+        self.index_path = Path(index_path or f'{path}.okved.db')
+        self.connection = sqlite3.connect(self.index_path)
+        self.connection.executescript(SCHEMA)
+
+    def members(self) -> Dict[str, int]:
+        """Файлы архива: {имя файла: CRC}"""
+        with zipfile.ZipFile(self.path, 'r') as zipobj:
+            return {info.filename: info.CRC for info in zipobj.infolist() if not info.is_dir()}
+
+    def stale_members(self) -> List[str]:
+        """Файлы архива, которых нет в индексе или которые изменились с момента индексации"""
+        indexed = dict(self.connection.execute('select member, crc from members'))
+        return [member for member, crc in self.members().items() if indexed.get(member) != crc]
+
+    def build(self, nproc: int = 1) -> dict:
+        """Индексирует новые и изменившиеся файлы архива в пуле процессов,
+           удаляет из индекса файлы, которых больше нет в архиве"""
+        crcs = self.members()
+        stale = self.stale_members()
+        removed = [member for member, in self.connection.execute('select member from members')
+                   if member not in crcs]
+        with self.connection:
+            for member in stale + removed:
+                self.drop_member(member)
+        worker = partial(collected, index_member, self.path)
+        with ProcessPool(processes=nproc) as process_pool:
+            for (member, records, entries), snapshot in process_pool.imap_unordered(worker, stale):
+                metrics.merge(snapshot)
+                # Каждый файл индексируется отдельной транзакцией: прерванная индексация продолжится
+                with self.connection:
+                    member_id = self.connection.execute('insert into members(member, crc, records) '
+                                                        'values(?, ?, ?)',
+                                                        (member, crcs[member], records)).lastrowid
+                    self.connection.executemany('insert or ignore into okved values(?, ?, ?, ?)',
+                                                ((code, member_id, offset, main)
+                                                 for code, offset, main in entries))
+                metrics.count('index.records', records)
+        metrics.count('index.members', len(stale))
+        return dict(indexed=len(stale), removed=len(removed), members=len(crcs))
+
+    def drop_member(self, member: str):
+        row = self.connection.execute('select id from members where member = ?', (member,)).fetchone()
+        if row is not None:
+            self.connection.execute('delete from okved where member_id = ?', row)
+            self.connection.execute('delete from members where id = ?', row)
+
+    def locate(self, prefixes: Iterable[str] = OKVED_PREFIXES,
+               main_only: bool = True) -> Dict[str, List[Tuple[int, str, bool]]]:
+        """Записи с ОКВЭД по заданным префиксам: {файл: [(смещение, код, основной)]} в порядке файлов"""
+        located = defaultdict(list)
+        for prefix in prefixes:
+            rows = self.connection.execute(
+                'select m.member, o.offset, o.code, o.main from okved o join members m on m.id = o.member_id '
+                f'where o.code glob ? {"and o.main" if main_only else ""}',
+                (glob_escape(prefix) + '*',))
+            for member, offset, code, main in rows:
+                located[member].append((offset, code, bool(main)))
+        return {member: sorted(set(entries), key=lambda entry: (entry[0], not entry[2], entry[1]))
+                for member, entries in located.items()}
+
+    def extract(self, prefixes: Iterable[str] = OKVED_PREFIXES, main_only: bool = True,
+                members: 'Iterable[str] | None' = None, max_workers: int = 4,
+                refresh: bool = True) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """Выборка записей с ОКВЭД по префиксам через индекс: (файл, DF) по мере готовности файлов.
+           Читаются только файлы с подходящими записями; main_only=False добавляет строки
+           по дополнительным ОКВЭД (type_okved='Доп'). Устаревший индекс обновляется (refresh)
+           или вызывает ошибку"""
+        if self.stale_members():
+            if not refresh:
+                raise RuntimeError(f'OKVED index {self.index_path} is stale')
+            self.build()
+        located = self.locate(prefixes, main_only)
+        if members is not None:
+            located = {member: located[member] for member in members if member in located}
+        metrics.count('index.members_read', len(located))
+        metrics.count('index.members_skipped', len(self.members()) - len(located))
+
+        def read_member(zipobj: zipfile.ZipFile, member: str) -> pd.DataFrame:
+            with metrics.timer('zip.read'):
+                text = zipobj.read(member).decode('utf-8')
+            with metrics.timer('index.parse'):
+                return records_frame(text, located[member])
+
+        for member, future in pipeline(self.path, list(located), read_member, max_workers):
+            yield member, future.result()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def glob_escape(prefix: str) -> str:
+    """Экранирует спецсимволы GLOB в префиксе"""
+    return ''.join(f'[{char}]' if char in '*?[' else char for char in prefix)
+
+
+def records_frame(text: str, entries: List[Tuple[int, str, bool]]) -> pd.DataFrame:
+    """Разбирает только записи по заданным смещениям и формирует строки по найденным кодам ОКВЭД"""
+    decoder = json.JSONDecoder()
+    rows = []
+    last_offset = None
+    for offset, code, main in entries:
+        if offset != last_offset:  # строки одной записи идут подряд
+            record, _ = decoder.raw_decode(text, offset)
+            names = {(_code, _main): name for _code, name, _main in record_codes(record)}
+            last_offset = offset
+        row = {col: record.get(col) for col in COLS}
+        row.update(code_okved=code, name_okved=names.get((code, main)), type_okved='Осн' if main else 'Доп')
+        rows.append(row)
+    return pd.DataFrame(rows, columns=COLS + OKVED_COLS)
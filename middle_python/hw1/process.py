@@ -1,87 +1,318 @@
-import zipfile
 import sqlite3
+import sys
 import pandas as pd
+from contextlib import closing
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, wait
-from time import sleep
-from typing import List, Tuple
+from queue import Queue, Empty
+from threading import Thread
+from time import monotonic, perf_counter
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Tuple
 from zipfile import ZipFile
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'common'))  # общие модули hw1 и hw2: metrics, parquet_sink
+from metrics import metrics, run_report
+from multiprocutils import COLS, OKVED_COLS, OKVED_PREFIXES, parser_stream, pipeline, processor_df, read_json_member
+if TYPE_CHECKING:
+    from okved_index import OkvedIndex
+    from parquet_sink import ParquetSink
 
 
-def unpacker(path: str, files: List[str], batch_size: int) -> List[pd.DataFrame]:
-    """Распаковщик данных из zip-архива и парсер JSON"""
+def unpacker(path: str, files: List[str], batch_size: int, stream: bool = False,
+             prefixes: Iterable[str] = OKVED_PREFIXES,
+             max_bytes: 'int | None' = None) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """Распаковщик данных из zip-архива, парсер JSON и фильтр по ОКВЭД.
+       В обработке одновременно не более batch_size файлов (и не более max_bytes распакованных байт),
+       результаты возвращаются по мере готовности каждого файла"""
 
-    def parser_json(zipobj: ZipFile, json_file: str) -> Tuple[str, pd.DataFrame]:
-        """Парсит один файл JSON"""
+    def parser_json(zipobj: ZipFile, json_file: str) -> pd.DataFrame:
+        """Парсит и фильтрует один файл JSON"""
+        if not stream:
+            return processor_df(read_json_member(zipobj, json_file), prefixes)
         with zipobj.open(json_file) as file:
-            return (json_file, pd.read_json(file))
+            return parser_stream(file, prefixes)
 
-    with zipfile.ZipFile(path, 'r') as zipobj:
-        with ThreadPoolExecutor(max_workers=batch_size) as executor:
-            data_sets = []
-            futures = []
-            current_slice = files
+    count = 0
+    with open('logging.log', 'a') as log:
+        for filename, future in pipeline(path, files, parser_json, batch_size, max_bytes):
+            df = future.result()
+            count += 1
+            print(f"\t\tFile {filename} loaded ({count})", file=log, flush=True)
+            yield filename, df
 
-            count = 0
-            with open('logging.log', 'a') as log:
-                while current_slice:
-                    for i in range(batch_size):
-                        if i < len(current_slice):
-                            futures.append(executor.submit(parser_json, zipobj, current_slice[i]))
-                    success_futures, _ = wait(futures)
-                    for future in success_futures:
-                        filename, df = future.result()
-                        count += 3
-                        print(f"\t\tFile {filename} loaded ({count})", file=log, flush=True)
-                        data_sets.append(df)
-                    yield data_sets
-                    data_sets = []
-                    futures = []
-                    current_slice = current_slice[batch_size:]
-
-
-def parser_data(value: dict) -> dict:
-    # Получаем значения КодОКВЭД и НаимОКВЭД. Если нет, устанавливаем значения в None
-    main_val = dict(code_okved=value.get('СвОКВЭД', {}).get('СвОКВЭДОсн', {}).get('КодОКВЭД', None),
-                    name_okved=value.get('СвОКВЭД', {}).get('СвОКВЭДОсн', {}).get('НаимОКВЭД', None),
-                    type_okved='Осн')
-    # Фильтруем по 61 ОКВЭД
-    code = main_val['code_okved']
-    return main_val if code and code.startswith('61') else None
-
-
-def persist_df(df: pd.DataFrame):
-    while True:  # sqllite does not supports concurrent access
+
+CREATE_STMT = """
+create table if not exists telecom_companiesokved(
+    inn integer,
+    ogrn integer,
+    kpp integer,
+    name text,
+    full_name text,
+    code_okved text,
+    name_okved text,
+    type_okved text,
+    member text
+)
+"""
+
+# Файл архива загружается отдельно для каждого набора префиксов ОКВЭД
+LEDGER_STMT = """
+create table if not exists load_ledger(
+    member text,
+    prefixes text,
+    crc integer,
+    rows integer,
+    loaded_at timestamp,
+    primary key (member, prefixes)
+)
+"""
+
+PRAGMAS = ('pragma journal_mode=WAL',
+           'pragma synchronous=NORMAL',
+           'pragma temp_store=MEMORY',
+           'pragma cache_size=-65536')
+
+
+def ledger_key(prefixes: Iterable[str]) -> str:
+    """Ключ набора префиксов ОКВЭД в журнале загрузки: префиксы без повторов через запятую"""
+    return ','.join(sorted(set(prefixes)))
+
+
+def keys_overlap(key: str, other: str) -> bool:
+    """Могут ли загрузки с двумя наборами префиксов содержать одни и те же строки"""
+    return any(prefix.startswith(other_prefix) or other_prefix.startswith(prefix)
+               for prefix in key.split(',') for other_prefix in other.split(','))
+
+
+def loaded_members(db_name: str = 'hw1.db') -> Dict[Tuple[str, str], int]:
+    """Возвращает загруженные ранее файлы архива из журнала загрузки: {(имя файла, ключ префиксов): CRC}"""
+    with closing(sqlite3.connect(db_name)) as connection:
         try:
-            with sqlite3.connect('hw1.db') as connection:
-                while Path('hw1.db-journal').exists():  # await wile temp file in use
-                    sleep(.5)
-                df.to_sql('telecom_companiesokved', connection,
-                          if_exists='append',
-                          index=False,
-                          method='multi')
-                connection.commit()
-                break
-        except sqlite3.Error as ex:
+            return {(member, prefixes): crc for member, prefixes, crc
+                    in connection.execute('select member, prefixes, crc from load_ledger')}
+        except sqlite3.OperationalError:  # журнала ещё нет
+            return {}
+
+
+class SQLiteWriter(Thread):
+    """Единственный писатель в БД (sqlite не поддерживает конкурентную запись).
+       Получает DF из ограниченной очереди и записывает их крупными транзакциями
+       через одно открытое соединение. Производители блокируются на put,
+       если очередь заполнена. Если для DF указан файл архива, запись о нём
+       попадает в журнал загрузки load_ledger в той же транзакции, что и его строки,
+       а при replace=True в той же транзакции удаляются строки прежней загрузки файла"""
+
+    def __init__(self, db_name: str = 'hw1.db', table_name: str = 'telecom_companiesokved', *,
+                 maxsize: int = 16, batch_rows: int = 50_000, batch_seconds: float = 5.0):
+        super().__init__(name='sqlite-writer', daemon=True)
+        self.db_name = db_name
+        self.table_name = table_name
+        self.batch_rows = batch_rows
+        self.batch_seconds = batch_seconds
+        self.queue = Queue(maxsize=maxsize)
+        self.rows = 0
+        self.commits = 0
+        self.seconds = 0.0  # время работы писателя
+        self.write_seconds = 0.0  # время, затраченное непосредственно на запись
+        self.error = None
+
+    def put(self, df: pd.DataFrame, member: 'str | None' = None, crc: 'int | None' = None,
+            key: 'str | None' = None, replace: bool = False):
+        """Ставит DF в очередь на запись (блокируется при заполненной очереди).
+           member, crc и key - файл архива, из которого получен DF, и ключ префиксов для журнала загрузки.
+           replace - удалить строки файла member с кодами ОКВЭД по префиксам key, загруженные ранее"""
+        if self.error is not None:
+            raise RuntimeError(f'SQLite writer failed: {self.error}')
+        if len(df) or member is not None:
+            # Ожидание места в очереди - время, на которое писатель задерживает производителей
+            with metrics.timer('writer.queue_wait'):
+                self.queue.put((df, member, crc, key, replace))
+
+    def close(self) -> dict:
+        """Дописывает остаток очереди, закрывает соединение и возвращает статистику"""
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise RuntimeError(f'SQLite writer failed: {self.error}')
+        return self.stats()
+
+    def loaded(self) -> Dict[Tuple[str, str], int]:
+        """Загруженные ранее файлы архива: {(имя файла, ключ префиксов): CRC}"""
+        return loaded_members(self.db_name)
+
+    def stats(self) -> dict:
+        return dict(rows=self.rows,
+                    commits=self.commits,
+                    seconds=round(self.seconds, 3),
+                    write_seconds=round(self.write_seconds, 3),
+                    rows_per_sec=round(self.rows / self.seconds, 1) if self.seconds else 0.0,
+                    write_rows_per_sec=round(self.rows / self.write_seconds, 1) if self.write_seconds else 0.0)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self):
+        start = perf_counter()
+        connection = sqlite3.connect(self.db_name, check_same_thread=False)
+        done = False
+        try:
+            for pragma in PRAGMAS:
+                connection.execute(pragma)
+            connection.execute(CREATE_STMT)
+            # Таблица, созданная до появления журнала загрузки, получает столбец файла архива
+            if 'member' not in {row[1] for row in connection.execute(f'pragma table_info({self.table_name})')}:
+                connection.execute(f'alter table {self.table_name} add column member text')
+            connection.execute(f'create index if not exists ix_{self.table_name}_member on {self.table_name}(member)')
+            connection.execute(LEDGER_STMT)
+            batch, ledger, columns = [], [], None
+            deadline = monotonic() + self.batch_seconds
+            while not done:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - monotonic()))
+                except Empty:
+                    item = None  # истёк таймаут - сбрасываем накопленное
+                else:
+                    done = item is None
+                if item is not None:
+                    df, member, crc, key, replace = item
+                    if len(df):
+                        if columns is not None and list(df.columns) != columns:
+                            self._flush(connection, columns, batch, ledger)
+                            batch, ledger = [], []
+                        columns = list(df.columns)
+                        batch.extend(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+                    if member is not None:
+                        ledger.append((member, key, crc, len(df), replace))
+                if done or len(batch) >= self.batch_rows or monotonic() >= deadline:
+                    self._flush(connection, columns, batch, ledger)
+                    batch, ledger, deadline = [], [], monotonic() + self.batch_seconds
+        except Exception as ex:
+            self.error = ex
             with open('logging.log', 'a') as log:
                 print(f"\tPersist failed cause {ex}", file=log, flush=True)
-        sleep(.5)  # each retry within 500 ms
-
-
-def process_df(path: str, files: List[str], batch_size: int):
-    provider = unpacker(path, files, batch_size)
-    try:
-        for batch in provider:
-            for df in batch:
-                """Парсер и обработчик данных"""
-                # Парсим атрибут data и записываем данные в общий DF
-                df = df.assign(data=df.data.apply(parser_data))
-                # Исключаем пустые данные (т.е. те, что не попали под ОКВЭД 61)
-                df = df[df.data.notna()]
-                # Разбиваем атрибут data на столбцы, и добавляем их в общий DF
-                persist_df(df[['ogrn', 'inn', 'kpp', 'name', 'full_name']].join(df.data.apply(pd.Series)))
-        return 0
-    except Exception as ex:
+            # Вычитываем очередь до конца, чтобы не заблокировать производителей
+            while not done:
+                done = self.queue.get() is None
+        finally:
+            connection.close()
+            self.seconds = perf_counter() - start
+            stats = self.stats()
+            with open('logging.log', 'a') as log:
+                print(f"\tPersisted {stats['rows']} rows in {stats['commits']} commits, "
+                      f"{stats['rows_per_sec']} rows/s ({stats['write_rows_per_sec']} rows/s of write time)", file=log, flush=True)
+
+    def _flush(self, connection: sqlite3.Connection, columns: 'List[str] | None', batch: list, ledger: list):
+        """Записывает накопленные строки и отметки о загруженных файлах одной транзакцией.
+           Строки прежних загрузок заменяемых файлов удаляются в той же транзакции"""
+        if not batch and not ledger:
+            return
+        start = perf_counter()
+        with connection:
+            for member, key, _, _, replace in ledger:
+                if replace:
+                    prefixes = key.split(',')
+                    connection.execute(f'delete from {self.table_name} where member = ? and '
+                                       f'({" or ".join(["code_okved like ?"] * len(prefixes))})',
+                                       [member] + [f'{prefix}%' for prefix in prefixes])
+            if batch:
+                stmt = (f'insert into {self.table_name}({", ".join(columns)}) '
+                        f'values({", ".join("?" * len(columns))})')
+                connection.executemany(stmt, batch)
+            connection.executemany("insert or replace into load_ledger(member, prefixes, crc, rows, loaded_at) "
+                                   "values(?, ?, ?, ?, datetime('now'))",
+                                   [(member, key, crc, rows) for member, key, crc, rows, _ in ledger])
+        self.write_seconds += perf_counter() - start
+        self.rows += len(batch)
+        self.commits += 1
+        metrics.add_time('writer.flush', perf_counter() - start)
+        metrics.count('writer.rows', len(batch))
+
+
+# Компактные типы столбцов результата для записи в Parquet
+PARQUET_DTYPES = dict(ogrn='int64', inn='int64', kpp='int64', name='string', full_name='string',
+                      code_okved='category', name_okved='category', type_okved='category', member='category')
+
+
+def replaced_rows(df: pd.DataFrame, member: str, key: str) -> pd.Series:
+    """Строки прежней загрузки файла архива member с префиксами ОКВЭД key"""
+    return (df.member == member) & df.code_okved.str.startswith(tuple(key.split(',')), na=False)
+
+
+def parquet_sink(root: str = 'telecom_companiesokved', **kwargs) -> 'ParquetSink':
+    """Приёмник результата в Parquet (вместо SQLiteWriter) с секциями по классу ОКВЭД - первым двум цифрам кода.
+       Прочитать результат: parquet_sink.read_parquet(root, filters=[('okved_prefix', '=', '61')])"""
+    from parquet_sink import ParquetSink
+    return ParquetSink(root, PARQUET_DTYPES, 'okved_prefix', lambda df: df.code_okved.str[:2],
+                       replaced=replaced_rows, **kwargs)
+
+
+def persist_df(df: pd.DataFrame, writer: 'SQLiteWriter | ParquetSink', member: 'str | None' = None,
+               crc: 'int | None' = None, key: 'str | None' = None, replace: bool = False):
+    """Передаёт DF единственному писателю в БД (или другому приёмнику).
+       Строки помечаются файлом архива member, replace - заменить строки его прежней загрузки"""
+    if member is not None:
+        df = df.assign(member=member)
+    with metrics.timer('persist_df'):
+        writer.put(df, member, crc, key, replace)
+    metrics.count('persist_df.rows', len(df))
+
+
+def process_df(path: str, files: List[str], batch_size: int, stream: bool = False,
+               writer: 'SQLiteWriter | ParquetSink | None' = None, prefixes: Iterable[str] = OKVED_PREFIXES,
+               max_bytes: 'int | None' = None, index: 'OkvedIndex | None' = None):
+    """Обрабатывает файлы архива и записывает результат в БД.
+       Распаковка, парсинг и фильтрация идут в пуле потоков, запись - в отдельном потоке писателя.
+       Несколько параллельных process_df должны получать общий writer.
+       Вместо SQLite результат можно записать в Parquet, передав writer=parquet_sink():
+       переданный приёмник сбрасывается в файлы по завершении, закрывает его вызывающий.
+       Файлы, уже отмеченные в журнале загрузки с тем же CRC и набором префиксов, пропускаются.
+       Строки прежней загрузки изменившегося файла (и загрузки с пересекающимися префиксами)
+       заменяются, а не дублируются.
+       С индексом ОКВЭД (okved_index.OkvedIndex) читаются только файлы с подходящими записями,
+       остальные отмечаются в журнале загрузки с текущим набором префиксов"""
+    # Отчёт о запуске с метриками стадий (и профилем при PROFILE=1) в каталоге reports
+    with run_report('hw1'):
+        own_writer = writer is None
+        if own_writer:
+            writer = SQLiteWriter()
+            writer.start()
+        with ZipFile(path, 'r') as zipobj:
+            crcs = {file: zipobj.getinfo(file).CRC for file in files}
+        key = ledger_key(prefixes)
+        loaded = writer.loaded()
+        pending = [file for file in files if loaded.get((file, key)) != crcs[file]]
+        # Файлы, строки которых по этим префиксам уже могут быть в приёмнике
+        replaced = {member for member, other in loaded if keys_overlap(key, other)}
         with open('logging.log', 'a') as log:
-            print(f"Processing fails {ex}", file=log, flush=True)
-        return str(ex)
+            print(f"Skipped {len(files) - len(pending)} loaded files, {len(pending)} to load", file=log, flush=True)
+        metrics.count('files.skipped', len(files) - len(pending))
+        if index is not None:
+            provider = index.extract(prefixes, members=pending, max_workers=batch_size)
+        else:
+            provider = unpacker(path, pending, batch_size, stream, prefixes, max_bytes)
+        try:
+            processed = set()
+            for filename, df in provider:
+                persist_df(df, writer, filename, crcs[filename], key, filename in replaced)
+                processed.add(filename)
+            # Файлы без подходящих записей (пропущенные по индексу) отмечаем в журнале только для этих префиксов:
+            # извлечение по другим префиксам их прочитает
+            for filename in pending:
+                if filename not in processed:
+                    persist_df(pd.DataFrame(columns=COLS + OKVED_COLS), writer, filename, crcs[filename],
+                               key, filename in replaced)
+            if own_writer:
+                writer.close()
+            elif hasattr(writer, 'flush'):  # приёмник Parquet держит строки в памяти до закрытия файлов
+                writer.flush()
+            return 0
+        except Exception as ex:
+            with open('logging.log', 'a') as log:
+                print(f"Processing fails {ex}", file=log, flush=True)
+            metrics.count('errors')
+            metrics.fail(ex)
+            if own_writer and writer.is_alive():
+                writer.queue.put(None)
+            return str(ex)
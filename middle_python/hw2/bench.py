@@ -0,0 +1,124 @@
+import os
+import random
+import re
+import sys
+from pathlib import Path
+from time import perf_counter
+from typing import List
+
+import json5
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'common'))  # общие модули hw1 и hw2: metrics, parquet_sink
+from metrics import measure, metrics, report_stem, save_report
+from stub_server import stub_server
+from utils import SkillNormalizer, get_data_by_api, get_details_by_api, iter_async, iter_pages
+
+
+def bench_details(num: int = 20, latency: float = 0.2, concurrency: int = 8, rate: float = 50) -> dict:
+    """Сравнивает последовательную и конкурентную загрузку деталей вакансий с заглушки API"""
+    timings = {}
+    with stub_server(latency) as base_url:
+        urls = [f'{base_url}/vacancies/{i}' for i in range(num)]
+
+        start = perf_counter()
+        sequential = [get_data_by_api(url) for url in urls]
+        timings['sequential'] = perf_counter() - start
+
+        start = perf_counter()
+        concurrent = get_details_by_api(urls, concurrency=concurrency, rate=rate)
+        timings['async'] = perf_counter() - start
+
+    assert sequential == concurrent
+    print(f'{num} вакансий, задержка {latency} с: последовательно {timings["sequential"]:.2f} с, '
+          f'асинхронно {timings["async"]:.2f} с (конкурентность {concurrency})')
+    return timings
+
+
+def normalizer_re(txt: 'str | None') -> 'str | None':
+    """Прежняя реализация нормализатора (для сравнения)"""
+    if not isinstance(txt, str):
+        return None
+    txt = txt.lower().strip().strip('.')
+    txt = re.sub(r'\s?framework\s?', '', txt)
+    if re.search('python', txt):
+        return 'python'
+    if re.search('rest|fast|api', txt):
+        return 'rest api'
+    if re.search('django', txt):
+        return 'django'
+    if re.search('git', txt):
+        return 'git'
+    if re.search('sql', txt):
+        return 'sql'
+    if re.search('docker', txt):
+        return 'docker'
+    if txt in ('asyncio', 'aiohttp', 'asinc.io', 'асинхронное программирование'):
+        return 'асинхронное программирование'
+    if txt in ('go', 'golang'):
+        return 'go'
+    return txt
+
+
+def bench_normalizer(num: int = 1_000_000, distinct: int = 300) -> dict:
+    """Сравнивает построчную и табличную нормализацию на num ключевых навыках"""
+    random.seed(0)
+    base = ['Python', ' Django Framework', 'REST API', 'FastAPI', 'Git', 'PostgreSQL', 'Docker',
+            'asyncio', 'Golang', 'Go', 'Linux', 'Kafka', 'Redis', 'ООП', 'Flask', 'aiohttp.']
+    skills = base + [f'{random.choice(base)} {i}' for i in range(distinct - len(base))] + [None]
+    values = pd.Series(random.choices(skills, k=num))
+    settings = json5.load(open('settings.json', encoding='utf-8'))
+
+    timings = {}
+    start = perf_counter()
+    expected = values.apply(normalizer_re)
+    timings['apply'] = perf_counter() - start
+
+    start = perf_counter()
+    result = SkillNormalizer(**settings['skills']).normalize(values)
+    timings['table'] = perf_counter() - start
+
+    assert expected.equals(result)
+    print(f'{num} навыков: построчно {timings["apply"]:.2f} с, по таблице правил {timings["table"]:.2f} с')
+    return timings
+
+
+def fetch_vacancies(base_url: str, num_vac: int, concurrency: int, rate: float, attempts: int = 3) -> dict:
+    """Загружает num_vac вакансий со страницами и деталями, как main.py (без кэша)"""
+    fetch_params = dict(concurrency=concurrency, rate=rate, attempts=attempts)
+    urls = [vacancy['url']
+            for items in iter_async(iter_pages(f'{base_url}/vacancies', dict(per_page=50), num_vac, **fetch_params))
+            for vacancy in items]
+    details = get_details_by_api(urls, **fetch_params)
+    return dict(vacancies=len(urls), details=sum(1 for item in details if item),
+                requests=metrics.counters.get('http.requests', 0))
+
+
+def bench_fetchers(num_vac: int = 500, latency: float = 0.1, jitter: float = 0.05, error_rate: float = 0.02,
+                   configs=((1, 100), (8, 100), (16, 100), (8, 20))) -> List[dict]:
+    """Сравнивает конфигурации загрузки (concurrency, rate) на заглушке API с задержкой и ошибками 429/5xx:
+       время, количество запросов в секунду и пиковую память. Каждая конфигурация выполняется
+       в отдельном процессе с одинаковой последовательностью ошибок заглушки"""
+    results = []
+    for concurrency, rate in configs:
+        with stub_server(latency, num_vac, jitter=jitter, error_rate=error_rate) as base_url:
+            run = measure(fetch_vacancies, base_url, num_vac, concurrency, rate)
+        result = run['result']
+        results.append(dict(concurrency=concurrency, rate=rate, seconds=run['seconds'],
+                            requests_per_sec=round(result['requests'] / run['seconds'], 1),
+                            peak_rss_mb=run['peak_rss_mb'], **result))
+        print(f'concurrency={concurrency:<3} rate={rate:<4} {run["seconds"]:6.2f} с, '
+              f'{result["requests"] / run["seconds"]:6.1f} запросов/с, пик памяти {run["peak_rss_mb"]} МБ, '
+              f'вакансий: {result["vacancies"]}, деталей: {result["details"]}, запросов: {result["requests"]}')
+    print('Результаты:', save_report(report_stem('bench-hw2'),
+                                     dict(num_vac=num_vac, latency=latency, jitter=jitter,
+                                          error_rate=error_rate, results=results)))
+    return results
+
+
+if __name__ == '__main__':
+    bench_fetchers(int(os.environ.get('BENCH_VACANCIES', 500)),
+                   latency=float(os.environ.get('BENCH_LATENCY', 0.1)),
+                   error_rate=float(os.environ.get('BENCH_ERRORS', 0.02)))
+    bench_details(int(os.environ.get('BENCH_DETAILS', 20)))
+    bench_normalizer(int(os.environ.get('BENCH_SKILLS', 1_000_000)))
@@ -0,0 +1,137 @@
+import json
+import sqlite3
+from threading import Lock
+from time import time
+from typing import Dict, List, Tuple
+from urllib.parse import urlencode, urlsplit
+
+
+CREATE_STMT = """
+create table if not exists responses(
+    key text primary key,
+    body blob,
+    etag text,
+    last_modified text,
+    expires_at real,
+    accessed_at real,
+    size integer
+)
+"""
+
+
+class ResponseCache:
+    """Персистентный кэш ответов API в SQLite.
+       Ключ - URL с параметрами запроса. Время жизни задаётся по префиксу пути URL (ttl),
+       устаревшие ответы перепроверяются условным запросом (ETag / If-Modified-Since),
+       при превышении max_mb вытесняются давно не использованные ответы.
+       В режиме offline ответы берутся только из кэша"""
+
+    def __init__(self, path: str = 'http_cache.db', *, ttl: 'Dict[str, float] | None' = None,
+                 default_ttl: float = 600, max_mb: float = 200, offline: bool = False):
+        self.path = path
+        self.ttl = ttl or {}
+        self.default_ttl = default_ttl
+        self.max_bytes = int(max_mb * 2 ** 20)
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evicted = 0
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute('pragma journal_mode=WAL')
+        self.connection.execute(CREATE_STMT)
+        # Текущий объём кэша, поддерживается при записи и вытеснении
+        self.size, = self.connection.execute('select coalesce(sum(size), 0) from responses').fetchone()
+
+    @staticmethod
+    def key(url: str, params: 'List[Tuple[str, str]] | None' = None) -> str:
+        """Ключ кэша: URL и отсортированные параметры запроса"""
+        return f'{url}?{urlencode(sorted(params))}' if params else url
+
+    def ttl_for(self, url: str) -> float:
+        """Время жизни ответа для URL по самому длинному подходящему префиксу пути"""
+        path = urlsplit(url).path
+        prefixes = [prefix for prefix in self.ttl if path.startswith(prefix)]
+        return self.ttl[max(prefixes, key=len)] if prefixes else self.default_ttl
+
+    def get(self, key: str) -> 'Tuple[bytes, str | None, str | None, bool] | None':
+        """Возвращает (тело, ETag, Last-Modified, признак свежести) или None"""
+        with self.lock:
+            row = self.connection.execute('select body, etag, last_modified, expires_at from responses '
+                                          'where key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute('update responses set accessed_at = ? where key = ?', (time(), key))
+        body, etag, last_modified, expires_at = row
+        return body, etag, last_modified, expires_at > time()
+
+    def conditional_headers(self, entry: 'Tuple | None') -> dict:
+        """Заголовки условного запроса для устаревшего ответа"""
+        headers = {}
+        if entry is not None:
+            _, etag, last_modified, _ = entry
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def lookup(self, key: str) -> 'Tuple[dict | None, Tuple | None]':
+        """Ищет ответ в кэше. Возвращает (данные, запись кэша);
+           данные не None, если запрос к API не нужен"""
+        entry = self.get(key)
+        if entry is not None and (entry[3] or self.offline):
+            with self.lock:
+                self.hits += 1
+            return json.loads(entry[0]), entry
+        if self.offline:
+            with self.lock:
+                self.misses += 1
+            print('Offline mode: no cached response for', key)
+            return {}, None
+        return None, entry
+
+    def not_modified(self, url: str, key: str, entry: Tuple) -> dict:
+        """Обрабатывает ответ 304: продлевает срок жизни закэшированного ответа"""
+        with self.lock:
+            self.connection.execute('update responses set expires_at = ? where key = ?',
+                                    (time() + self.ttl_for(url), key))
+            self.revalidated += 1
+            self.hits += 1
+        return json.loads(entry[0])
+
+    def store(self, url: str, key: str, body: bytes, headers: dict):
+        """Сохраняет ответ и при необходимости вытесняет старые"""
+        now = time()
+        with self.lock:
+            self.misses += 1
+            row = self.connection.execute('select size from responses where key = ?', (key,)).fetchone()
+            self.size += len(body) - (row[0] if row else 0)
+            self.connection.execute('insert or replace into responses '
+                                    'values(?, ?, ?, ?, ?, ?, ?)',
+                                    (key, body, headers.get('ETag'), headers.get('Last-Modified'),
+                                     now + self.ttl_for(url), now, len(body)))
+            self.evict()
+
+    def evict(self):
+        """Вытесняет давно не использованные ответы, пока кэш больше max_bytes.
+           Вызывается под self.lock"""
+        if self.size <= self.max_bytes:
+            return
+        rows = self.connection.execute('select key, size from responses order by accessed_at')
+        keys = []
+        for key, size in rows:
+            if self.size <= self.max_bytes:
+                break
+            keys.append((key,))
+            self.size -= size
+        self.connection.executemany('delete from responses where key = ?', keys)
+        self.evicted += len(keys)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(hits=self.hits, misses=self.misses, revalidated=self.revalidated, evicted=self.evicted)
+
+    def close(self):
+        self.connection.close()
@@ -1,102 +1,184 @@
-import pandas as pd
-from time import sleep
-import json5
-from utils import (areas_parser, get_query, execute, get_data_by_api,
-                   data_parser, list_to_str, update_table, normalizer)
-
-
-settings = json5.load(open('settings.json', encoding='utf-8'))
-
-# globals().update(**settings)
-db_name = settings['db_name']
-num_vac = settings['num_vac']
-url_vac = settings['url_vac']
-
-url_areas = settings['url_areas']
-country = settings['country']
-regions = settings['regions']
-
-url_params = settings['url_params']
-
-
-areas_dct = areas_parser(url_areas, country, regions)  # получаем id заданных регионов
-areas_lst = list(areas_dct)
-
-url_params['area'] = areas_lst
-
-
-def get_vacancies(url, params, vacancies=None):
-    """Получает список вакансий по заданному URL с параметрами"""
-    if vacancies is None:
-        vacancies = []
-
-    if params.get('page', 0) < params.get('pages', 1):
-        data = get_data_by_api(url, params)
-        _vacancies = data.get('items', [])
-        found, page, pages = data.get('found', 0), data.get('page', 0), data.get('pages', 1)
-        params.update(found=found, page=page + 1, pages=pages)
-        print(f'\tНайдено: {found}, страниц: {pages}, страница: {page}')
-        vacancies += _vacancies
-
-        # Количество вакансий
-        print('Количество спарсенных со стр', page,
-              'вакансий по заданным параметрам:', len(_vacancies),
-              'всего спарсено вакансий:', len(vacancies), end='\n\n')
-
-        if len(vacancies) < (found if found < num_vac else num_vac) and page < pages:
-            sleep(3)
-            get_vacancies(url, params, vacancies)
-    return vacancies
-
-
-def attributes_processing(vacancies_df: pd.DataFrame):
-    """Обработка DF вакансий"""
-    # Парсим атрибуты, достаём названия у тех, которые имеют форму словарей/списков
-    # и добавляем в DF вакансий
-    print()
-    for attrib in vacancies_df:
-        if attrib in ('employer', 'salary'):
-            continue
-        print('\tParsing attribute', attrib)
-        data = vacancies_df[attrib].apply(data_parser)
-        if isinstance(data, pd.DataFrame):
-            if 'name' in data:
-                vacancies_df[attrib] = data['name']
-        else:
-            vacancies_df[attrib] = data
-    print()
-
-
-def employers_proccessing(vacancies_df: pd.DataFrame):
+import argparse
+import json
+import sys
+from contextlib import closing
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Tuple
+from cache import ResponseCache
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'common'))  # общие модули hw1 и hw2: metrics, parquet_sink
+from metrics import metrics, run_report
+from utils import (get_query, execute, get_details_by_api, iter_async, iter_pages, iter_threaded, flatten,
+                   get_view, resolve_areas, strip_html, update_table, vacuum_if_fragmented, default_normalizer,
+                   SkillNormalizer, Session)
+# pandas, json5, search и parquet_sink импортируются в функциях, которые их используют:
+# импорт модуля и разбор аргументов командной строки не ждут загрузки тяжёлых библиотек
+if TYPE_CHECKING:
+    import pandas as pd
+    from parquet_sink import ParquetSink
+
+
+SETTINGS_PATH = 'settings.json'
+
+# Параметры запуска. Импорт модуля ничего не читает и не загружает:
+# параметры задаёт configure() (main() - по settings.json и аргументам командной строки)
+settings: dict = {}
+db_name = 'hw2.db'
+num_vac = None
+url_vac = None
+url_params: dict = {}
+# Режим синхронизации: full - полная перезагрузка, incremental - только новые вакансии
+sync: dict = {}
+sync_mode = 'full'
+# Нормализатор ключевых навыков по таблице правил из настроек
+skill_normalizer = default_normalizer
+# Восстанавливать ключевые навыки по описанию, если работодатель их не указал
+backfill_skills = False
+# Кэш ответов API
+cache = None
+# параметры конкурентной загрузки вакансий
+fetch_params: dict = {}
+
+
+def load_settings(path: str = SETTINGS_PATH) -> dict:
+    """Читает настройки из файла json5"""
+    import json5
+    with open(path, encoding='utf-8') as file:
+        return json5.load(file)
+
+
+def configure(config: dict):
+    """Задаёт параметры модуля по настройкам и открывает кэш ответов API"""
+    global settings, db_name, num_vac, url_vac, url_params, sync, sync_mode, skill_normalizer, \
+        backfill_skills, cache, fetch_params
+    settings = config
+    db_name = settings['db_name']
+    num_vac = settings['num_vac']
+    url_vac = settings['url_vac']
+    url_params = dict(settings['url_params'])
+    sync = settings.get('sync', {})
+    sync_mode = sync.get('mode', 'full')
+    skill_normalizer = SkillNormalizer(**settings.get('skills', {}))
+    backfill_skills = settings.get('backfill_skills', False)
+    cache = ResponseCache(**settings['cache']) if settings.get('cache') else None
+    fetch_params = dict(settings.get('fetch', {}), cache=cache)
+
+
+def parse_args(argv: 'List[str] | None' = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Загрузка вакансий hh.ru в SQLite. '
+                                                 'Аргументы переопределяют значения из файла настроек')
+    parser.add_argument('--settings', default=SETTINGS_PATH, help='файл настроек (json5)')
+    parser.add_argument('--regions', nargs='+', help='регионы поиска')
+    parser.add_argument('--query', help='текст поискового запроса')
+    parser.add_argument('--num-vac', type=int, help='сколько вакансий загрузить после фильтров (режим full)')
+    parser.add_argument('--concurrency', type=int, help='одновременных запросов к API')
+    parser.add_argument('--mode', choices=('full', 'incremental'), help='режим синхронизации')
+    parser.add_argument('--offline', action='store_true', help='ответы API только из кэша')
+    parser.add_argument('--refresh-areas', action='store_true', help='заново получить id регионов из API')
+    return parser.parse_args(argv)
+
+
+def apply_args(config: dict, args: argparse.Namespace) -> dict:
+    """Настройки с учётом аргументов командной строки (исходный словарь не изменяется)"""
+    config = dict(config)
+    if args.regions:
+        config['regions'] = args.regions
+    if args.query is not None:
+        config['url_params'] = dict(config['url_params'], text=args.query)
+    if args.num_vac is not None:
+        config['num_vac'] = args.num_vac
+    if args.concurrency is not None:
+        config['fetch'] = dict(config.get('fetch', {}), concurrency=args.concurrency)
+    if args.mode is not None:
+        config['sync'] = dict(config.get('sync', {}), mode=args.mode)
+    if args.offline and config.get('cache'):
+        config['cache'] = dict(config['cache'], offline=True)
+    return config
+
+
+# Описание столбцов таблиц: {столбец: путь в ответе API} или {столбец: (путь, тип)}
+VACANCY_FIELDS = {
+    'id': 'id',
+    'position': 'name',
+    'url': 'url',
+    'alternate_url': 'alternate_url',
+    'area': 'area.name',
+    'employment': 'employment.name',
+    'experience': 'experience.name',
+    'professional_roles': 'professional_roles[0].name',
+    'salary_from': ('salary.from', 'float'),
+    'salary_to': ('salary.to', 'float'),
+    'salary_currency': 'salary.currency',
+    'salary_gross': 'salary.gross',
+    'company_id': 'employer.id',
+    'company_name': 'employer.name',
+    'company_trusted': 'employer.trusted',
+    'published_at': 'published_at',
+    'created_at': 'created_at',
+    'archived': 'archived'
+}
+EMPLOYER_FIELDS = {
+    'id': 'employer.id',
+    'name': 'employer.name',
+    'url': 'employer.url',
+    'alternate_url': 'employer.alternate_url',
+    'vacancies_url': 'employer.vacancies_url',
+    'accredited_it_employer': 'employer.accredited_it_employer',
+    'trusted': 'employer.trusted'
+}
+DETAILS_FIELDS = {
+    'job_description': 'description',
+    'key_skills': 'key_skills[].name'
+}
+# Компактные типы столбцов для записи в Parquet
+VACANCY_DTYPES = {
+    'id': 'int64',
+    'position': 'string',
+    'job_description': 'string',
+    'url': 'string',
+    'alternate_url': 'string',
+    'area': 'category',
+    'employment': 'category',
+    'experience': 'category',
+    'professional_roles': 'category',
+    'key_skills': 'string',
+    'salary_from': 'float64',
+    'salary_to': 'float64',
+    'salary_currency': 'category',
+    'salary_gross': 'bool',
+    'company_id': 'int64',
+    'company_name': 'string',
+    'published_at': 'datetime',
+    'created_at': 'datetime',
+    'archived': 'bool'
+}
+KEY_SKILLS_DTYPES = {
+    'vacancy_id': 'int64',
+    'name': 'string',
+    'normalized_name': 'category'
+}
+
+
+def get_vacancies(url: str, params: dict, num_vac: 'int | None' = None) -> Iterator[List[dict]]:
+    """Получает вакансии по заданному URL с параметрами постранично.
+       Страницы после первой загружаются конкурентно, params не изменяются"""
+    count = 0
+    with closing(iter_async(iter_pages(url, params, num_vac, **fetch_params))) as pages:
+        for vacancies in pages:
+            count += len(vacancies)
+            # Количество вакансий
+            print('Количество спарсенных со страницы вакансий по заданным параметрам:', len(vacancies),
+                  'всего спарсено вакансий:', count, end='\n\n')
+            yield vacancies
+
+
+def employers_proccessing(vacancies: List[dict]) -> 'pd.DataFrame':
     # Парсим работодателей в DF для создания отдельной таблицы
-    employers_df = vacancies_df.employer.apply(data_parser)
-    # Убираем лишний атрибут logo_urls
-    employers_df.drop(columns='logo_urls', inplace=True)
-
-    vacancies_df[
-        [
-            'company_id',
-            'company_name',
-            'company_trusted'
-        ]
-    ] = employers_df[
-        [
-            'id',
-            'name',
-            'trusted'
-        ]
-    ]
-
-    # vacancies_df = pd.concat([vacancies_df,
-    #                          employers_df.add_prefix('company_')],
-    #                         axis=1)
+    employers_df = flatten(vacancies, EMPLOYER_FIELDS)
     # Убираем дубли
-    employers_df = employers_df[~employers_df.duplicated()]
-    # Запись DF в таблицу БД employers
-    update_table('employers', db_name, employers_df)
+    return employers_df[~employers_df.duplicated()]
 
 
-def key_skills_processing(vacancies_df: pd.DataFrame):
+def key_skills_processing(vacancies_df: 'pd.DataFrame') -> 'pd.DataFrame':
     # Сздаём отдельный DF с ключевыми скиллами
     key_skills_df = vacancies_df[
         ['id', 'key_skills']
@@ -112,76 +194,46 @@ def key_skills_processing(vacancies_df: pd.DataFrame):
                                                      else x)
     # Растягиваем списки на атомарные значения после разбивки
     key_skills_df = key_skills_df.explode('name', ignore_index=True)
+    # Вакансия без навыков остаётся строкой с пустым name: в БД по ней удаляются прежние навыки вакансии
     # Нормализуем ключевые слова
-    key_skills_df['normalized_name'] = key_skills_df.name.apply(normalizer)
+    key_skills_df['normalized_name'] = skill_normalizer.normalize(key_skills_df.name)
 
     # Убираем дубли
     key_skills_df = key_skills_df[~key_skills_df.duplicated()]
     # Запись DF в таблицу БД key_skills
     update_table('key_skills', db_name, key_skills_df)
+    return key_skills_df[key_skills_df.name.notna()]
 
 
-def vacancies_processing(df: pd.DataFrame = pd.DataFrame()):
-    """Обработка списка вакансий и преобразование в таблицы"""
-    print('\nПарсинг страницы', url_params.get('page'), end='\n\n')
-    fill_vac = [{}] * len(df)
-    vacancies = get_vacancies(url_vac, url_params, fill_vac)
-    found, page, pages = (url_params.get('found', 0),
-                          url_params.get('page', 0),
-                          url_params.get('pages', 0))
-    print(f'Спарсено {len(vacancies)} вакансий, с {page} страниц')
-
-    # Парсим список вакансий в DF и оставляем только нужные атрибуты
-    vacancy_attribs = ['id', 'name', 'url', 'alternate_url', 'employer', 'area',
-                       'employment', 'salary', 'experience', 'professional_roles',
-                       'published_at', 'created_at', 'archived']
-    global vacancies_df
-    vacancies_df = pd.DataFrame(vacancies)[vacancy_attribs]
-    # очистка DF от добавленных пустых строк
-    vacancies.clear()  # очистка массива со спарсенными ранее вакансиями
-    vacancies_df = vacancies_df.dropna(how='all').reset_index(drop=True)
-    vacancies_df.rename(columns=dict(name='position'), inplace=True)
-    # Убираем архивные вакансии
-    vacancies_df = vacancies_df[~vacancies_df.archived.fillna(False)]
-
-    # Обрабатываем атрибуты
-    attributes_processing(vacancies_df)
-
-    # Записываем спарсенные компании в таблицу employers
-    employers_proccessing(vacancies_df)
-
-    # Парсим зарплаты
-    salary_df = vacancies_df.salary.apply(data_parser)
-    vacancies_df = pd.concat([vacancies_df,
-                              salary_df.add_prefix('salary_')], axis=1)
+def vacancies_batch_processing(vacancies: List[dict]) -> 'pd.DataFrame':
+    """Обработка части списка вакансий: атрибуты, детали и фильтры"""
+    import pandas as pd
+    # Парсим список вакансий в DF с нужными атрибутами
+    vacancies_df = flatten(vacancies, VACANCY_FIELDS)
+    # Детали запрашиваем только для вакансий проверенных работодателей, остальные всё равно отфильтруются
+    vacancies_df = vacancies_df[vacancies_df.company_trusted.fillna(False).astype(bool) &
+                                ~vacancies_df.id.duplicated()]
 
     # Парсим дополнительные атрибуты по каждой вакансии по API и записываем в DF вакансий
     print('Парсинг детального описания каждой из вакансий\n')
-    vacancies_df['details'] = vacancies_df.url.apply(get_data_by_api)
-    details_df = vacancies_df.details.apply(data_parser)
-    details_df = details_df[
-        ['description',
-         'key_skills']
-    ].rename(
-        columns=dict(
-            description='job_description'
-        )
-    )
-
+    with metrics.timer('stage.details'):
+        details = get_details_by_api(vacancies_df.url.tolist(), **fetch_params)
+    details_df = flatten(details, DETAILS_FIELDS, index=vacancies_df.index)
     vacancies_df = pd.concat([vacancies_df, details_df], axis=1)
+    # Описание без HTML-разметки - текст полнотекстового индекса vacancies_fts
+    vacancies_df['description_text'] = vacancies_df.job_description.map(strip_html)
 
-    # Обработка атрибута key_skills
-    vacancies_df['key_skills'] = vacancies_df.key_skills.apply(list_to_str)
     # Оставляем только те вакансии, в которых указаны ключевые навыки,
     # которые разместили проверенные работодатели,имеющие аккредитацию IT компании
-    vacancies_df = vacancies_df[vacancies_df.company_trusted &
-                                # vacancies_df.company_accredited_it_employer &
-                                vacancies_df.key_skills.notna()]
+    # (при backfill_skills вакансии без навыков оставляем - навыки восстановятся по описанию)
+    vacancies_df = vacancies_df[  # vacancies_df.company_accredited_it_employer &
+                                vacancies_df.key_skills.notna() | backfill_skills]
     # убираем лишние атрибуты
     vacancies_attribs = [
         'id',
         'position',
         'job_description',
+        'description_text',
         'url',
         'alternate_url',
         'area',
@@ -199,38 +251,162 @@ def vacancies_processing(df: pd.DataFrame = pd.DataFrame()):
         'created_at',
         'archived'
     ]
-    vacancies_df = pd.concat([df, vacancies_df[vacancies_attribs]], ignore_index=True)
-    # Убираем дубли
-    vacancies_df = vacancies_df[~vacancies_df.id.duplicated()]
-    print('\nРазмер массива вакансий после применённых фильтров:', len(vacancies_df))
-    print()
-    if len(vacancies_df) < (found if found < num_vac else num_vac) and page < pages:
-        # Если количество вакансий после фильтров оказалось меньше 100,
-        # и при этом найдено более 100 вакансий, то запускаем процесс заново
-        sleep(10)  # ожидание чтобы не попасть на капчу
-        vacancies_processing(vacancies_df.copy(deep=True))
-        return
-    print(f'Всего спарсено {len(vacancies_df)} и будет загружено в таблицу vacancies', end='\n\n')
-
-    update_table('vacancies', db_name, vacancies_df)
-
-    # Записываем спарсенные клчевые навыки в таблицу key_skills
-    key_skills_processing(vacancies_df)
-
-    # Очистка БД от мусора
-    execute('vacuum', db_name)
-
-
-def main():
-    # Создаём таблицу employers в БД
-    execute(get_query('create_employers.sql'), db_name)
-    # Создаём таблицу vacancies в БД
-    execute(get_query('create_vacancies.sql'), db_name)
-    # Создаём таблицу key_skills в БД
-    execute(get_query('create_key_skills.sql'), db_name)
-
-    vacancies_processing()
+    return vacancies_df[vacancies_attribs]
+
+
+def page_processing(vacancies: List[dict]) -> 'Tuple[dict | None, pd.DataFrame, pd.DataFrame]':
+    """Стадия конвейера: обработка одной страницы вакансий.
+       Возвращает самую свежую вакансию страницы, DF работодателей и DF отобранных вакансий"""
+    with metrics.timer('stage.page_processing'):
+        vacancies = [vacancy for vacancy in vacancies if vacancy]
+        metrics.count('vacancies.rows_in', len(vacancies))
+        latest = max(({'published_at': vacancy['published_at'], 'vacancy_id': int(vacancy['id'])}
+                      for vacancy in vacancies),
+                     key=lambda vacancy: (vacancy['published_at'], vacancy['vacancy_id']), default=None)
+        # Убираем архивные вакансии
+        vacancies = [vacancy for vacancy in vacancies if not vacancy.get('archived')]
+        vacancies_df = vacancies_batch_processing(vacancies)
+        metrics.count('vacancies.rows_out', len(vacancies_df))
+        return latest, employers_proccessing(vacancies), vacancies_df
+
+
+def persist_page(employers_df: 'pd.DataFrame', vacancies_df: 'pd.DataFrame',
+                 sinks: 'Dict[str, ParquetSink] | None' = None):
+    """Записывает обработанную страницу одной транзакцией: при сбое теряется не больше страницы.
+       Записанные вакансии и навыки дублируются в приёмники Parquet, если они заданы"""
+    import pandas as pd
+    from search import backfill_key_skills
+    with metrics.timer('stage.persist_page'), Session.get(db_name).transaction():
+        # Записываем спарсенные компании в таблицу employers
+        update_table('employers', db_name, employers_df)
+        update_table('vacancies', db_name, vacancies_df)
+        # Записываем спарсенные клчевые навыки в таблицу key_skills
+        key_skills_df = key_skills_processing(vacancies_df)
+        if backfill_skills:
+            # Навыки вакансий без key_skills ищем в описании через полнотекстовый индекс
+            backfill_df, backfilled = backfill_key_skills(db_name, vacancies_df.id[vacancies_df.key_skills.isna()],
+                                                          normalizer=skill_normalizer)
+            # Восстановленные навыки попадают и в приёмники Parquet
+            if backfilled:
+                key_skills_df = pd.concat([key_skills_df, backfill_df], ignore_index=True)
+                restored = vacancies_df.id.astype(int).map(backfilled)
+                vacancies_df = vacancies_df.assign(key_skills=restored.fillna(vacancies_df.key_skills))
+    if sinks:
+        sinks['vacancies'].put(vacancies_df)
+        sinks['key_skills'].put(key_skills_df)
+
+
+def parquet_sinks(path: str = 'parquet', partition_by: 'str | None' = 'area') -> 'Dict[str, ParquetSink]':
+    """Приёмники Parquet для вакансий (с секциями по partition_by) и ключевых навыков.
+       В Parquet вакансии только дописываются: при повторной загрузке
+       читать последнюю версию вакансии по id"""
+    from parquet_sink import ParquetSink
+    return {'vacancies': ParquetSink(f'{path}/vacancies', VACANCY_DTYPES, partition_by),
+            'key_skills': ParquetSink(f'{path}/key_skills', KEY_SKILLS_DTYPES)}
+
+
+def query_key(params: dict) -> str:
+    """Ключ поискового запроса для хранения водяного знака (без параметров постраничности)"""
+    return json.dumps({key: value for key, value in params.items()
+                       if key not in ('page', 'pages', 'per_page', 'found', 'date_from', 'order_by')},
+                      ensure_ascii=False, sort_keys=True)
+
+
+def get_watermark(key: str) -> 'dict | None':
+    """Последняя обработанная вакансия (published_at, vacancy_id) по поисковому запросу"""
+    df = get_view(get_query('select_watermark.sql'), db_name, params=dict(query_key=key))
+    if not len(df):
+        return None
+    return dict(published_at=df.published_at[0], vacancy_id=int(df.vacancy_id[0]))
+
+
+def vacancies_processing():
+    """Обработка списка вакансий и преобразование в таблицы.
+       Конвейер: загрузка страниц -> детали и фильтры -> запись в БД. Стадии связаны
+       ограниченными очередями, каждая страница записывается до того, как в памяти окажутся
+       следующие. В режиме full страницы обрабатываются, пока после фильтров не наберётся num_vac вакансий.
+       В режиме incremental загружаются все вакансии, опубликованные после водяного знака, без ограничения
+       num_vac. Водяной знак сдвигается на самую свежую полученную вакансию только после загрузки всех
+       страниц, поэтому прерванный запуск не пропускает не загруженные вакансии"""
+    params = dict(url_params)
+    key = query_key(params)
+    watermark = None
+    if sync_mode == 'incremental':
+        params.update(order_by='publication_time')
+        watermark = get_watermark(key)
+    if watermark is not None:
+        print('Загрузка вакансий, опубликованных с', watermark['published_at'])
+        params.update(date_from=watermark['published_at'])
+    latest = watermark
+    limit = num_vac if sync_mode == 'full' else None
+    completed = True
+    saved = set()  # id записанных вакансий
+    sinks = parquet_sinks(**settings['parquet']) if settings.get('parquet') else {}
+    pages = iter_threaded(page_processing, get_vacancies(url_vac, params), settings.get('queue_size', 1))
+    try:
+        for page_latest, employers_df, vacancies_df in pages:
+            # Запоминаем самую свежую из полученных вакансий
+            if page_latest is not None and (latest is None or
+                                            (page_latest['published_at'], page_latest['vacancy_id']) >
+                                            (latest['published_at'], latest['vacancy_id'])):
+                latest = page_latest
+            persist_page(employers_df, vacancies_df, sinks)
+            saved.update(vacancies_df.id)
+            print('\nЗаписано вакансий после применённых фильтров:', len(saved), end='\n\n')
+            if limit is not None and len(saved) >= limit:
+                completed = False  # оставшиеся страницы не нужны
+                break
+    finally:
+        # Останавливает загрузку и обработку страниц, в том числе при сбое записи
+        pages.close()
+        for sink in sinks.values():
+            sink.close()
+    print(f'Всего загружено {len(saved)} вакансий в таблицу vacancies', end='\n\n')
+
+    # Водяной знак сдвигается, только если получены все новые вакансии
+    if completed and latest is not None and latest != watermark:
+        execute(get_query('upsert_watermark.sql'), db_name, params=dict(query_key=key, **latest))
+
+    # Очистка БД от мусора, если она заметно фрагментирована
+    vacuum_if_fragmented(db_name, sync.get('vacuum_threshold', 0.2))
+
+    if cache is not None:
+        print('Кэш ответов API:', cache.stats())
+        for name, value in cache.stats().items():
+            metrics.count(f'cache.{name}', value)
+
+
+def main(argv: 'List[str] | None' = None):
+    args = parse_args(argv)
+    from search import add_description_text
+    configure(apply_args(load_settings(args.settings), args))
+    # Отчёт о запуске с метриками стадий (и профилем при PROFILE=1) в каталоге reports
+    with run_report('hw2'):
+        # id заданных регионов: из локального кэша или разбором дерева регионов API
+        with metrics.timer('stage.areas'):
+            areas = resolve_areas(settings['url_areas'], settings['country'], settings['regions'], cache,
+                                  settings.get('areas_cache', 'areas.json'), refresh=args.refresh_areas)
+        url_params['area'] = list(areas)
+
+        if sync_mode == 'full':
+            # Полная перезагрузка: пересоздаём таблицы
+            execute(get_query('drop_tables.sql'), db_name)
+        # Создаём таблицу employers в БД
+        execute(get_query('create_employers.sql'), db_name)
+        # Создаём таблицу vacancies в БД
+        execute(get_query('create_vacancies.sql'), db_name)
+        add_description_text(db_name)
+        # Создаём полнотекстовый индекс по описаниям вакансий
+        execute(get_query('create_vacancies_fts.sql'), db_name)
+        # Создаём таблицу key_skills в БД
+        execute(get_query('create_key_skills.sql'), db_name)
+        # Создаём таблицу с водяными знаками синхронизации
+        execute(get_query('create_sync_state.sql'), db_name)
+
+        vacancies_processing()
+
+        Session.close_all()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
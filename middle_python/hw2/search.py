@@ -0,0 +1,90 @@
+import json
+import pandas as pd
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+from utils import Session, SkillNormalizer, default_normalizer, get_query, strip_html, update_table
+
+
+def add_description_text(db_name: str):
+    """Добавляет в таблицу vacancies, созданную до появления description_text,
+       описание без HTML-разметки для полнотекстового индекса vacancies_fts"""
+    session = Session.get(db_name)
+    with session.transaction():
+        if 'description_text' in set(session.read_sql("select name from pragma_table_info('vacancies')").name):
+            return
+        session.execute(get_query('add_description_text.sql'))
+        df = session.read_sql('select id, job_description from vacancies')
+        session.execute('update vacancies set description_text = ? where id = ?',
+                        params=list(zip(df.job_description.map(strip_html), df.id.astype(int))), many=True)
+    print('Описания без HTML-разметки добавлены для', len(df), 'вакансий')
+
+
+def fts_query(text: str, phrase: bool = False, column: 'str | None' = None) -> str:
+    """Запрос FTS5 по тексту пользователя: все слова (в любом порядке) или фраза целиком.
+       Слова берутся в кавычки, поэтому спецсимволы FTS5 в тексте не мешают"""
+    words = [text] if phrase else text.split()
+    query = ' '.join('"' + word.replace('"', '""') + '"' for word in words)
+    return f'{column} : ({query})' if column else query
+
+
+def search_vacancies(text: str, db_name: str, limit: int = 20, phrase: bool = False,
+                     raw: bool = False) -> pd.DataFrame:
+    """Поиск вакансий по названию и описанию, упорядоченный по релевантности (bm25).
+       raw=True - text является выражением FTS5 (OR, NOT, NEAR, префиксы word*)"""
+    query = text if raw else fts_query(text, phrase)
+    return Session.get(db_name).read_sql(get_query('search_vacancies.sql'), params=dict(query=query, limit=limit))
+
+
+def match_ids(session: Session, query: str, ids: 'Iterable[int] | None' = None) -> List[int]:
+    """id вакансий, подходящих под запрос FTS5. ids - проверять только эти вакансии
+       (для небольшого списка это намного быстрее обхода всех совпадений)"""
+    sql = 'select rowid from vacancies_fts where vacancies_fts match ?'
+    params = (query,)
+    if ids is not None:
+        sql += ' and rowid in (select value from json_each(?))'
+        params += (json.dumps([int(vacancy_id) for vacancy_id in ids]),)
+    return [rowid for rowid, in session.fetchall(sql, params)]
+
+
+def count_skill_mentions(skills: Iterable[str], db_name: str) -> pd.DataFrame:
+    """Количество вакансий, в описании которых навык упоминается как фраза.
+       Сравнение без учёта регистра, знаки препинания внутри навыка считаются разделителями слов"""
+    session = Session.get(db_name)
+    counts = [(skill, len(match_ids(session, fts_query(skill, phrase=True, column='description_text'))))
+              for skill in skills]
+    return pd.DataFrame(counts, columns=['skill', 'counts']).sort_values('counts', ascending=False,
+                                                                          ignore_index=True)
+
+
+def backfill_key_skills(db_name: str, vacancy_ids: 'Iterable[int] | None' = None, top: int = 200,
+                        normalizer: SkillNormalizer = default_normalizer) -> Tuple[pd.DataFrame, Dict[int, str]]:
+    """Восстанавливает ключевые навыки вакансий с пустым key_skills по упоминаниям в описании.
+       Словарь навыков - top самых частых названий из key_skills. Найденные навыки записываются
+       в key_skills и в столбец key_skills вакансии. Возвращает записанные строки key_skills
+       и новые значения key_skills дополненных вакансий: {id вакансии: навыки через запятую}"""
+    session = Session.get(db_name)
+    nothing = pd.DataFrame(columns=['vacancy_id', 'name', 'normalized_name']), {}
+    with session.transaction():
+        targets = set(session.read_sql(get_query('select_vacancies_without_skills.sql')).id)
+        if vacancy_ids is not None:
+            targets &= {int(vacancy_id) for vacancy_id in vacancy_ids}
+        if not targets:
+            return nothing
+        found = defaultdict(list)
+        for name in session.read_sql(get_query('select_skill_names.sql'), params=dict(limit=top)).name:
+            query = fts_query(name, phrase=True, column='description_text')
+            for vacancy_id in match_ids(session, query, targets if vacancy_ids is not None else None):
+                if vacancy_id in targets:
+                    found[vacancy_id].append(name)
+        if not found:
+            return nothing
+        key_skills_df = pd.DataFrame([(vacancy_id, name) for vacancy_id, names in found.items() for name in names],
+                                     columns=['vacancy_id', 'name'])
+        key_skills_df['normalized_name'] = normalizer.normalize(key_skills_df.name)
+        update_table('key_skills', db_name, key_skills_df)
+        key_skills = {vacancy_id: ', '.join(names) for vacancy_id, names in found.items()}
+        session.execute(get_query('update_vacancy_key_skills.sql'),
+                        params=[dict(id=vacancy_id, key_skills=names) for vacancy_id, names in key_skills.items()],
+                        many=True)
+    print('Ключевые навыки восстановлены по описанию для', len(found), 'вакансий')
+    return key_skills_df, key_skills
@@ -0,0 +1 @@
+alter table vacancies add column description_text text
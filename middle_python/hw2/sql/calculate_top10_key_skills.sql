@@ -1,5 +1,4 @@
-select normalized_name, count(normalized_name) counts
-from key_skills
-group by normalized_name
-order by counts desc
-limit 10
\ No newline at end of file
+select normalized_name, counts
+from key_skills_counts
+order by counts desc, normalized_name
+limit 10
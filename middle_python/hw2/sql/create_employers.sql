@@ -1,4 +1,3 @@
-drop table if exists employers;
 create table if not exists employers(
     id integer,
     name text,
@@ -7,4 +6,6 @@ create table if not exists employers(
     vacancies_url text,
     accredited_it_employer boolean,
     trusted boolean
-)
\ No newline at end of file
+);
+create unique index if not exists ux_employers_id_name on employers(coalesce(id, ''), coalesce(name, ''));
+create index if not exists ix_employers_id on employers(id)
\ No newline at end of file
@@ -1,8 +1,48 @@
-drop table if exists key_skills;
 create table if not exists key_skills(
     id integer primary key,
     vacancy_id integer,
     name text,
     normalized_name text,
     FOREIGN KEY(vacancy_id) REFERENCES vacancies(id)
-)
\ No newline at end of file
+);
+create unique index if not exists ux_key_skills_vacancy_name on key_skills(vacancy_id, coalesce(name, ''));
+create index if not exists ix_key_skills_normalized_name on key_skills(normalized_name);
+-- Сводная таблица количества вакансий по навыку, поддерживается триггерами
+create table if not exists key_skills_counts(
+    normalized_name text primary key,
+    counts integer not null
+);
+create index if not exists ix_key_skills_counts_counts on key_skills_counts(counts desc, normalized_name);
+-- Первичное заполнение сводной таблицы по уже загруженным навыкам
+insert into key_skills_counts(normalized_name, counts)
+select normalized_name, count(*)
+from key_skills
+where normalized_name is not null
+  and not exists (select 1 from key_skills_counts)
+group by normalized_name;
+create trigger if not exists tr_key_skills_counts_insert
+after insert on key_skills
+when new.normalized_name is not null
+begin
+    insert into key_skills_counts(normalized_name, counts)
+    values (new.normalized_name, 1)
+    on conflict(normalized_name) do update set counts = counts + 1;
+end;
+create trigger if not exists tr_key_skills_counts_delete
+after delete on key_skills
+when old.normalized_name is not null
+begin
+    update key_skills_counts set counts = counts - 1 where normalized_name = old.normalized_name;
+    delete from key_skills_counts where normalized_name = old.normalized_name and counts <= 0;
+end;
+create trigger if not exists tr_key_skills_counts_update
+after update of normalized_name on key_skills
+when old.normalized_name is not new.normalized_name
+begin
+    update key_skills_counts set counts = counts - 1 where normalized_name = old.normalized_name;
+    delete from key_skills_counts where normalized_name = old.normalized_name and counts <= 0;
+    insert into key_skills_counts(normalized_name, counts)
+    select new.normalized_name, 1
+    where new.normalized_name is not null
+    on conflict(normalized_name) do update set counts = counts + 1;
+end
@@ -0,0 +1,6 @@
+create table if not exists sync_state(
+    query_key text primary key,
+    published_at timestamptz,
+    vacancy_id integer,
+    updated_at timestamptz
+)
@@ -1,8 +1,8 @@
-drop table if exists vacancies;
 create table if not exists vacancies(
     id integer primary key,
     position text,
     job_description text,
+    description_text text,
     url text,
     alternate_url text,
     area text,
@@ -21,4 +21,7 @@ create table if not exists vacancies(
     archived boolean,
     FOREIGN KEY(company_id) REFERENCES employers(id),
     FOREIGN KEY(company_name) REFERENCES employers(name)
-)
\ No newline at end of file
+);
+-- Вакансии, учитываемые в аналитике: не в архиве и с ключевыми навыками
+create index if not exists ix_vacancies_company on vacancies(company_id, company_name)
+where not archived and key_skills is not null
\ No newline at end of file
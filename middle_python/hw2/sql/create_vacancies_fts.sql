@@ -0,0 +1,33 @@
+-- Полнотекстовый индекс по названию и описанию вакансий (description_text - описание без HTML-разметки).
+-- Индекс с внешним содержимым: тексты хранятся только в vacancies, индекс поддерживается триггерами
+create virtual table if not exists vacancies_fts using fts5(
+    position,
+    description_text,
+    content = 'vacancies',
+    content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+-- Первичное заполнение по уже загруженным вакансиям
+insert into vacancies_fts(vacancies_fts)
+select 'rebuild'
+where not exists (select 1 from vacancies_fts_docsize);
+create trigger if not exists tr_vacancies_fts_insert
+after insert on vacancies
+begin
+    insert into vacancies_fts(rowid, position, description_text)
+    values (new.id, new.position, new.description_text);
+end;
+create trigger if not exists tr_vacancies_fts_delete
+after delete on vacancies
+begin
+    insert into vacancies_fts(vacancies_fts, rowid, position, description_text)
+    values ('delete', old.id, old.position, old.description_text);
+end;
+create trigger if not exists tr_vacancies_fts_update
+after update of position, description_text on vacancies
+begin
+    insert into vacancies_fts(vacancies_fts, rowid, position, description_text)
+    values ('delete', old.id, old.position, old.description_text);
+    insert into vacancies_fts(rowid, position, description_text)
+    values (new.id, new.position, new.description_text);
+end
@@ -0,0 +1,5 @@
+drop table if exists vacancies_fts;
+drop table if exists key_skills_counts;
+drop table if exists key_skills;
+drop table if exists vacancies;
+drop table if exists employers
@@ -0,0 +1,11 @@
+select v.id,
+       v.position,
+       v.company_name,
+       v.area,
+       snippet(vacancies_fts, 1, '[', ']', '…', 12) snippet,
+       f.rank
+from vacancies_fts f
+join vacancies v on v.id = f.rowid
+where vacancies_fts match :query
+order by f.rank
+limit :limit
@@ -0,0 +1,6 @@
+select trim(name) name, count(distinct vacancy_id) counts
+from key_skills
+where trim(coalesce(name, '')) != ''
+group by trim(name)
+order by counts desc
+limit :limit
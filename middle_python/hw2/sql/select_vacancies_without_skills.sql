@@ -0,0 +1,3 @@
+select id
+from vacancies
+where coalesce(key_skills, '') = ''
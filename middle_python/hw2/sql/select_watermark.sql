@@ -0,0 +1,3 @@
+select published_at, vacancy_id
+from sync_state
+where query_key = :query_key
@@ -0,0 +1,3 @@
+update vacancies
+set key_skills = :key_skills
+where id = :id
@@ -0,0 +1,26 @@
+insert into employers(id,
+                      name,
+                      url,
+                      alternate_url,
+                      vacancies_url,
+                      accredited_it_employer,
+                      trusted)
+select id,
+       name,
+       url,
+       alternate_url,
+       vacancies_url,
+       accredited_it_employer,
+       trusted
+from staging_employers
+where true
+on conflict(coalesce(id, ''), coalesce(name, '')) do update
+set url = excluded.url,
+    alternate_url = excluded.alternate_url,
+    vacancies_url = excluded.vacancies_url,
+    accredited_it_employer = excluded.accredited_it_employer,
+    trusted = excluded.trusted
+where (employers.url, employers.alternate_url, employers.vacancies_url,
+       employers.accredited_it_employer, employers.trusted) is not
+      (excluded.url, excluded.alternate_url, excluded.vacancies_url,
+       excluded.accredited_it_employer, excluded.trusted)
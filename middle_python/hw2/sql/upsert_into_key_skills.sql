@@ -0,0 +1,17 @@
+-- Навыки обновлённых вакансий заменяются целиком; вакансия без навыков передаётся строкой с пустым name
+delete from key_skills
+where vacancy_id in (select vacancy_id from staging_key_skills)
+  and (vacancy_id, coalesce(name, '')) not in (select vacancy_id, coalesce(name, '')
+                                               from staging_key_skills
+                                               where name is not null);
+insert into key_skills(vacancy_id,
+                       name,
+                       normalized_name)
+select vacancy_id,
+       name,
+       normalized_name
+from staging_key_skills
+where name is not null
+on conflict(vacancy_id, coalesce(name, '')) do update
+set normalized_name = excluded.normalized_name
+where key_skills.normalized_name is not excluded.normalized_name
@@ -0,0 +1,100 @@
+insert into vacancies(id,
+                      position,
+                      job_description,
+                      description_text,
+                      url,
+                      alternate_url,
+                      area,
+                      employment,
+                      experience,
+                      professional_roles,
+                      key_skills,
+                      salary_from,
+                      salary_to,
+                      salary_currency,
+                      salary_gross,
+                      company_id,
+                      company_name,
+                      published_at,
+                      created_at,
+                      archived)
+select id,
+       position,
+       job_description,
+       description_text,
+       url,
+       alternate_url,
+       area,
+       employment,
+       experience,
+       professional_roles,
+       key_skills,
+       salary_from,
+       salary_to,
+       salary_currency,
+       salary_gross,
+       company_id,
+       company_name,
+       published_at,
+       created_at,
+       archived
+from staging_vacancies
+where true
+on conflict(id) do update
+set position = excluded.position,
+    job_description = excluded.job_description,
+    description_text = excluded.description_text,
+    url = excluded.url,
+    alternate_url = excluded.alternate_url,
+    area = excluded.area,
+    employment = excluded.employment,
+    experience = excluded.experience,
+    professional_roles = excluded.professional_roles,
+    key_skills = excluded.key_skills,
+    salary_from = excluded.salary_from,
+    salary_to = excluded.salary_to,
+    salary_currency = excluded.salary_currency,
+    salary_gross = excluded.salary_gross,
+    company_id = excluded.company_id,
+    company_name = excluded.company_name,
+    published_at = excluded.published_at,
+    created_at = excluded.created_at,
+    archived = excluded.archived
+where (vacancies.position,
+       vacancies.job_description,
+       vacancies.description_text,
+       vacancies.url,
+       vacancies.alternate_url,
+       vacancies.area,
+       vacancies.employment,
+       vacancies.experience,
+       vacancies.professional_roles,
+       vacancies.key_skills,
+       vacancies.salary_from,
+       vacancies.salary_to,
+       vacancies.salary_currency,
+       vacancies.salary_gross,
+       vacancies.company_id,
+       vacancies.company_name,
+       vacancies.published_at,
+       vacancies.created_at,
+       vacancies.archived) is not
+      (excluded.position,
+       excluded.job_description,
+       excluded.description_text,
+       excluded.url,
+       excluded.alternate_url,
+       excluded.area,
+       excluded.employment,
+       excluded.experience,
+       excluded.professional_roles,
+       excluded.key_skills,
+       excluded.salary_from,
+       excluded.salary_to,
+       excluded.salary_currency,
+       excluded.salary_gross,
+       excluded.company_id,
+       excluded.company_name,
+       excluded.published_at,
+       excluded.created_at,
+       excluded.archived)
@@ -0,0 +1,6 @@
+insert into sync_state(query_key, published_at, vacancy_id, updated_at)
+values(:query_key, :published_at, :vacancy_id, datetime('now'))
+on conflict(query_key) do update
+set published_at = excluded.published_at,
+    vacancy_id = excluded.vacancy_id,
+    updated_at = excluded.updated_at
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import random
+import re
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import sleep
+from typing import Iterator
+from urllib.parse import parse_qs, urlsplit
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Заглушка API hh.ru для тестов и бенчмарков"""
+    latency = 0.0  # задержка ответа, с
+    jitter = 0.0  # случайная добавка к задержке, от 0 до jitter с
+    found = 500  # всего вакансий по запросу
+    error_rate = 0.0  # доля запросов, на которые отвечаем ошибкой
+    errors = (429, 500, 503)  # коды ошибок, выбираются случайно
+    retry_after = 1  # значение Retry-After для ответа 429, с
+    rng = random.Random(0)
+    lock = Lock()
+
+    def do_GET(self):
+        with self.lock:
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            status = self.rng.choice(self.errors) if self.rng.random() < self.error_rate else None
+        sleep(delay)
+        if status is not None:
+            return self.send_error_json(status)
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/areas':
+            self.send_json(areas())
+        elif url.path == '/vacancies':
+            page = int(query.get('page', ['0'])[0])
+            per_page = int(query.get('per_page', ['20'])[0])
+            self.send_json(vacancies_page(self.base_url(), page, per_page, self.found,
+                                          query.get('date_from', [None])[0],
+                                          query.get('order_by', [None])[0]))
+        elif match := re.fullmatch(r'/vacancies/(\d+)', url.path):
+            self.send_json(vacancy_details(int(match[1])))
+        else:
+            self.send_json({'errors': [{'type': 'not_found'}]}, status=404)
+
+    def base_url(self) -> str:
+        return f'http://{self.headers.get("Host")}'
+
+    def send_error_json(self, status: int):
+        """Ответ ошибкой: 429 с Retry-After или ошибка сервера"""
+        body = json.dumps({'errors': [{'type': 'too_many_requests' if status == 429 else 'server_error'}]}).encode()
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', str(self.retry_after))
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data: 'dict | list', status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def areas() -> list:
+    """Дерево регионов"""
+    regions = ['Москва', 'Санкт-Петербург', 'Краснодарский край', 'Новосибирская область']
+    return [dict(id='113', parent_id=None, name='Россия',
+                 areas=[dict(id=str(i + 1), parent_id='113', name=name, areas=[])
+                        for i, name in enumerate(regions)]),
+            dict(id='5', parent_id=None, name='Украина', areas=[])]
+
+
+def vacancy(base_url: str, vacancy_id: int) -> dict:
+    """Синтетическая вакансия из списка вакансий"""
+    employer_id = vacancy_id % 50
+    return dict(id=str(vacancy_id),
+                name=f'Middle Python Developer {vacancy_id}',
+                url=f'{base_url}/vacancies/{vacancy_id}',
+                alternate_url=f'https://hh.ru/vacancy/{vacancy_id}',
+                employer=dict(id=str(employer_id), name=f'Компания {employer_id}',
+                              url=f'{base_url}/employers/{employer_id}',
+                              alternate_url=f'https://hh.ru/employer/{employer_id}',
+                              logo_urls=None,
+                              vacancies_url=f'{base_url}/vacancies?employer_id={employer_id}',
+                              accredited_it_employer=bool(employer_id % 2),
+                              trusted=employer_id % 10 != 0),
+                area=dict(id='1', name='Москва', url=f'{base_url}/areas/1'),
+                employment=dict(id='full', name='Полная занятость'),
+                salary=dict(**{'from': 100000 + vacancy_id, 'to': None}, currency='RUR', gross=False)
+                if vacancy_id % 3 else None,
+                experience=dict(id='between3And6', name='От 3 до 6 лет'),
+                professional_roles=[dict(id='96', name='Программист, разработчик')],
+                published_at=published_at(vacancy_id),
+                created_at=published_at(vacancy_id),
+                archived=False)
+
+
+def published_at(vacancy_id: int) -> str:
+    """Дата публикации вакансии: чем больше id, тем позже"""
+    return (datetime(2023, 5, 1) + timedelta(minutes=vacancy_id)).strftime('%Y-%m-%dT%H:%M:%S+0300')
+
+
+def vacancies_page(base_url: str, page: int, per_page: int, found: int,
+                   date_from: 'str | None' = None, order_by: 'str | None' = None) -> dict:
+    """Страница списка вакансий (с фильтром по дате публикации и сортировкой)"""
+    ids = [1000 + i for i in range(found)]
+    if date_from is not None:
+        ids = [i for i in ids if published_at(i) >= date_from]
+    if order_by == 'publication_time':
+        ids.reverse()
+    pages = -(-len(ids) // per_page)
+    return dict(items=[vacancy(base_url, i) for i in ids[page * per_page:(page + 1) * per_page]],
+                found=len(ids), pages=pages, page=page, per_page=per_page)
+
+
+def vacancy_details(vacancy_id: int) -> dict:
+    """Детальное описание синтетической вакансии"""
+    return dict(id=str(vacancy_id),
+                name=f'Middle Python Developer {vacancy_id}',
+                description=f'<p>Вакансия {vacancy_id}: <strong>Python</strong>, Django, PostgreSQL</p>',
+                key_skills=[{'name': 'Python'}, {'name': 'Django Framework'}, {'name': 'SQL'}]
+                if vacancy_id % 4 else [])
+
+
+@contextmanager
+def stub_server(latency: float = 0.0, found: int = 500, port: int = 0, *, jitter: float = 0.0,
+                error_rate: float = 0.0, errors: tuple = (429, 500, 503), retry_after: int = 1,
+                seed: int = 0) -> Iterator[str]:
+    """Запускает заглушку API в фоновом потоке и возвращает её базовый URL.
+       latency и jitter задают задержку ответа, error_rate - долю ответов с ошибками errors
+       (последовательность ошибок воспроизводима при одном seed)"""
+    handler = type('Handler', (StubHandler,), dict(latency=latency, jitter=jitter, found=found,
+                                                   error_rate=error_rate, errors=tuple(errors),
+                                                   retry_after=retry_after,
+                                                   rng=random.Random(seed), lock=Lock()))
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}'
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -1,18 +1,39 @@
-import requests
-import pandas as pd
-from time import sleep
+import html
+import json
+import re
+import sys
+from time import monotonic, perf_counter, sleep
 import sqlite3
+from contextlib import contextmanager
+from math import ceil
 from pathlib import Path
-from typing import List, Literal
+from queue import Empty, Full, Queue
+from threading import Event, Lock, RLock, Thread
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Coroutine, Dict, Iterator, List, Literal, Tuple
+from cache import ResponseCache
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'common'))  # общие модули hw1 и hw2: metrics, parquet_sink
+from metrics import metrics
+# pandas, numpy, asyncio, aiohttp и requests импортируются в функциях, которые их используют:
+# импорт utils не должен замедлять запуск программы
+if TYPE_CHECKING:
+    import aiohttp
+    import pandas as pd
 
 
-def areas_parser(url: str, country: str, areas: List[str]) -> dict:
+def areas_parser(url: str, country: str, areas: List[str], cache: 'ResponseCache | None' = None) -> dict:
     """Парсит регионы и возвращает id для каждого региона"""
-    countries_df = pd.read_json(url)  # парсим сайт по URL
+    import pandas as pd
+    data = get_data_by_api(url, cache=cache)  # парсим сайт по URL
+    if not data:  # API недоступен или ответа нет в кэше в режиме offline
+        offline = cache is not None and cache.offline
+        raise RuntimeError(f'Areas are not available: {url} is not cached' if offline
+                           else f'Areas are not available: {url} is unreachable')
+    countries_df = pd.DataFrame(data)
     country_df = countries_df[countries_df.name == country]  # оставляем только заданную страну
+    if country_df.empty:
+        raise ValueError(f'Country {country!r} not found in {url}')
     areas_data = country_df.iloc[0].areas  # достаём данные с регионами только заданной страны
-    areas_json = str(areas_data).replace("'", '"')  # преобразуем в формат json
-    areas_df = pd.read_json(areas_json)  # парсим json в DF
+    areas_df = pd.DataFrame(areas_data)  # парсим регионы в DF
     areas_df = areas_df[areas_df.name.isin(areas)]  # оставляем только заданные регионы
     areas_df = areas_df[['id', 'name']]
     areas_dct = areas_df.set_index('id').name.to_dict()  # преобразовываем DF в словарь
@@ -20,74 +41,262 @@ def areas_parser(url: str, country: str, areas: List[str]) -> dict:
     return areas_dct
 
 
+def resolve_areas(url: str, country: str, areas: List[str], cache: 'ResponseCache | None' = None,
+                  path: str = 'areas.json', refresh: bool = False) -> dict:
+    """id регионов с локальным кэшем в файле path: дерево регионов загружается и разбирается,
+       только если этот набор регионов ещё не встречался (или refresh). Набор, в котором
+       не все регионы найдены, не кэшируется"""
+    key = json.dumps([url, country, sorted(areas)], ensure_ascii=False)
+    file = Path(path)
+    resolved = json.loads(file.read_text(encoding='utf-8')) if file.exists() else {}
+    if not refresh and key in resolved:
+        print(f'id регионов: {resolved[key]}')
+        return resolved[key]
+    areas_dct = areas_parser(url, country, areas, cache)
+    missing = set(areas) - set(areas_dct.values())
+    if missing:
+        print('Регионы не найдены:', ', '.join(sorted(missing)))
+    else:
+        resolved[key] = areas_dct
+        file.write_text(json.dumps(resolved, ensure_ascii=False, indent=2), encoding='utf-8')
+    return areas_dct
+
+
 def get_query(query_file_path: str) -> str:
     """Парсит SQL-запрос из файла"""
     return (Path('sql') / query_file_path).read_text(encoding='utf-8')
 
 
-def execute(query: str, db_name: str, params: 'dict | list | None' = None, many: bool = False) -> int:
-    try:
-        with sqlite3.connect(db_name) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = connection.cursor()
-            if len(query.strip(';').split(';')) > 1:
-                cursor.executescript(query)
+PRAGMAS = ('pragma journal_mode=WAL',
+           'pragma synchronous=NORMAL',
+           'pragma temp_store=MEMORY')
+
+
+HTML_TAG = re.compile(r'<[^>]*>')
+SPACES = re.compile(r'\s+')
+SPACE_BEFORE_PUNCT = re.compile(r'\s+([,.;:!?)])')
+
+
+def strip_html(text: 'str | None') -> 'str | None':
+    """Текст без HTML-разметки: теги заменяются пробелами, сущности раскодируются"""
+    if not isinstance(text, str):
+        return None
+    text = SPACES.sub(' ', html.unescape(HTML_TAG.sub(' ', text)))
+    return SPACE_BEFORE_PUNCT.sub(r'\1', text).strip()
+
+
+def split_statements(script: str) -> List[str]:
+    """Разбивает SQL-скрипт на отдельные запросы (';' внутри строк не считается разделителем)"""
+    statements, current = [], ''
+    for part in script.split(';'):
+        current += part + ';'
+        if sqlite3.complete_statement(current):
+            if current.strip(' \t\r\n;'):
+                statements.append(current.strip())
+            current = ''
+    if current.strip(' \t\r\n;'):
+        statements.append(current.strip())
+    return statements
+
+
+class Session:
+    """Сессия работы с БД: одно соединение на БД на всё время работы программы.
+       Прагмы применяются один раз при открытии, подготовленные запросы кэшируются
+       соединением, несколько запросов можно объединить в одну транзакцию.
+       Соединение общее для всех потоков: каждое обращение к нему идёт под блокировкой сессии,
+       поэтому запрос другого потока не попадает в чужую открытую транзакцию"""
+    sessions: Dict[str, 'Session'] = {}
+    sessions_lock = Lock()  # защищает реестр sessions
+
+    def __init__(self, db_name: str):
+        self.db_name = db_name
+        self.connection = sqlite3.connect(db_name, isolation_level=None,
+                                          check_same_thread=False, cached_statements=256)
+        for pragma in PRAGMAS:
+            self.connection.execute(pragma)
+        self.lock = RLock()
+        self.depth = 0  # уровень вложенности транзакций
+
+    @classmethod
+    def get(cls, db_name: str) -> 'Session':
+        """Возвращает открытую сессию для БД, создавая её при первом обращении"""
+        with cls.sessions_lock:
+            if db_name not in cls.sessions:
+                cls.sessions[db_name] = cls(db_name)
+            return cls.sessions[db_name]
+
+    @classmethod
+    def close_all(cls):
+        with cls.sessions_lock:
+            sessions = list(cls.sessions.values())
+            cls.sessions.clear()
+        for session in sessions:
+            with session.lock:
+                session.connection.close()
+
+    @contextmanager
+    def locked(self) -> Iterator[sqlite3.Connection]:
+        """Монопольный доступ к соединению сессии"""
+        start = perf_counter()
+        with self.lock:
+            metrics.add_time('db.lock_wait', perf_counter() - start)
+            yield self.connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Транзакция; вложенные транзакции становятся частью внешней"""
+        with self.locked():
+            if self.depth:
+                self.depth += 1
+                try:
+                    yield self.connection
+                finally:
+                    self.depth -= 1
+                return
+            self.connection.execute('begin')
+            self.depth = 1
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute('rollback')
+                raise
             else:
-                if params is None:
-                    cursor.execute(query)
+                self.connection.execute('commit')
+            finally:
+                self.depth = 0
+
+    def execute(self, query: str, params: 'dict | list | None' = None, many: bool = False) -> int:
+        """Выполняет запрос или скрипт из нескольких запросов, возвращает количество изменённых строк"""
+        statements = split_statements(query)
+        if len(statements) == 1 and not many:  # одиночный запрос атомарен и без явной транзакции
+            with self.locked() as connection:
+                return connection.execute(statements[0], params or ()).rowcount
+        rowcount = 0
+        with self.transaction() as connection:
+            for statement in statements:
+                if many:
+                    cursor = connection.executemany(statement, params)
                 else:
-                    if many:
-                        cursor.executemany(query, params)
-                    else:
-                        cursor.execute(query, params)
+                    cursor = connection.execute(statement, params or ())
+                rowcount += max(cursor.rowcount, 0)
+        return rowcount
+
+    def read_sql(self, query: str, params: 'dict | None' = None) -> 'pd.DataFrame':
+        import pandas as pd
+        with self.locked() as connection:
+            return pd.read_sql(query, connection, params=params)
+
+    def fetchall(self, query: str, params: 'dict | tuple | None' = None) -> List[tuple]:
+        """Строки результата запроса без построения DF"""
+        with self.locked() as connection:
+            return connection.execute(query, params or ()).fetchall()
+
+    def table_exists(self, table_name: str) -> bool:
+        return bool(self.fetchall("select 1 from sqlite_master where type = 'table' and name = ?", (table_name,)))
+
+    def upsert_df(self, df: 'pd.DataFrame', table_name: str, upsert_query: str) -> int:
+        """Массово обновляет таблицу: DF загружается во временную таблицу staging_<table_name>
+           с колонками целевой таблицы, затем upsert_query переносит строки в целевую таблицу"""
+        staging = f'staging_{table_name}'
+        with self.transaction() as connection:
+            connection.execute(f'drop table if exists temp.{staging}')
+            connection.execute(f'create temp table {staging} as select * from main.{table_name} where 0')
+            self.insert_df(df, staging)
+            rowcount = self.execute(upsert_query)
+            connection.execute(f'drop table temp.{staging}')
+        return rowcount
+
+    def insert_df(self, df: 'pd.DataFrame', table_name: str, if_exists: str = 'append') -> int:
+        """Записывает DF в таблицу одной транзакцией через executemany.
+           Если таблицы нет (или if_exists='replace'), она создаётся по схеме DF"""
+        import pandas as pd
+        with self.transaction() as connection:
+            exists = self.table_exists(table_name)
+            if exists and if_exists == 'fail':
+                raise ValueError(f'Table {table_name} already exists.')
+            if exists and if_exists == 'replace':
+                connection.execute(f'drop table {table_name}')
+            if not exists or if_exists == 'replace':
+                connection.execute(pd.io.sql.get_schema(df, table_name, con=connection))
+            columns = ', '.join(f'"{col}"' for col in df.columns)
+            stmt = f'insert into {table_name}({columns}) values({", ".join("?" * len(df.columns))})'
+            connection.executemany(stmt, df.astype(object).where(df.notna(), None)
+                                   .itertuples(index=False, name=None))
+        return len(df)
+
+
+def execute(query: str, db_name: str, params: 'dict | list | None' = None, many: bool = False) -> int:
+    try:
+        return Session.get(db_name).execute(query, params, many)
     except(Exception) as error:
         print(error)
-        connection.rollback()
-    else:
-        connection.commit()
-    finally:
-        cursor.close()
-    connection.close()
-    return cursor.rowcount
+        return -1
+
 
+def vacuum_if_fragmented(db_name: str, threshold: float = 0.2) -> bool:
+    """Выполняет VACUUM, только если доля свободных страниц БД больше threshold"""
+    session = Session.get(db_name)
+    (free_pages,), = session.fetchall('pragma freelist_count')
+    (pages,), = session.fetchall('pragma page_count')
+    fragmentation = free_pages / pages if pages else 0.0
+    print(f'Доля свободных страниц БД: {fragmentation:.1%}')
+    if fragmentation <= threshold:
+        return False
+    execute('vacuum', db_name)
+    return True
 
-def get_table(table_name: str, db_name: str) -> pd.DataFrame:
+
+def get_table(table_name: str, db_name: str) -> 'pd.DataFrame':
+    import pandas as pd
     try:
-        with sqlite3.connect(db_name) as connection:
-            df = pd.read_sql(f'select * from {table_name}', connection)
+        df = Session.get(db_name).read_sql(f'select * from {table_name}')
     except Exception as ex:
         print(ex)
         df = pd.DataFrame()
-    connection.close()
     return df
 
 
-def get_view(query: str, db_name: str, params: 'dict | None' = None) -> pd.DataFrame:
+def get_view(query: str, db_name: str, params: 'dict | None' = None) -> 'pd.DataFrame':
+    import pandas as pd
     try:
-        with sqlite3.connect(db_name) as connection:
-            df = pd.read_sql(query, connection, params=params)
+        df = Session.get(db_name).read_sql(query, params=params)
     except Exception as ex:
         print(ex)
         df = pd.DataFrame()
-    connection.close()
     return df
 
 
-def get_data_by_api(url: str, params: 'dict | None' = None, attempts: int = 3) -> dict:
+def get_data_by_api(url: str, params: 'dict | None' = None, attempts: int = 3,
+                    cache: 'ResponseCache | None' = None) -> dict:
     """Парсит данные с сайта по url api с заданными параметрами"""
+    import requests
+    if cache is not None:
+        key = cache.key(url, query_params(params))
+        data, entry = cache.lookup(key)
+        if data is not None:
+            return data
     for _try in range(attempts):
         # Запускаем запрос
-        result = requests.get(url, params=params)
+        headers = cache.conditional_headers(entry) if cache is not None else None
+        start = perf_counter()
+        result = requests.get(url, params=params, headers=headers)
+        observe_response(start, result.status_code, len(result.content))
         # Просматриваем запрошенный URL
         print('URL:', result.url)
         # Проверяем ответ
+        if result.status_code == 304 and cache is not None:
+            return cache.not_modified(url, key, entry)
         if result.status_code == 200:
             print('GET request sucessful')
-            sleep(1)
+            if cache is not None:
+                cache.store(url, key, result.content, result.headers)
+            with metrics.timer('http.rate_limit_wait'):
+                sleep(1)
             return result.json()
         else:
             print('Returned error code:', result.status_code)
-            sleep(20)
+            with metrics.timer('http.retry_wait'):
+                sleep(20)
             print(f'Attempt {_try + 1} from {attempts}')
     else:
         print('All attempts have been exhausted.',
@@ -95,7 +304,307 @@ def get_data_by_api(url: str, params: 'dict | None' = None, attempts: int = 3) -
         return {}
 
 
+def observe_response(start: float, status: 'int | str', size: int):
+    """Учитывает ответ API в метриках: задержка, статус и объём"""
+    metrics.observe('http.latency', perf_counter() - start)
+    metrics.count('http.requests')
+    metrics.count(f'http.status.{status}')
+    metrics.count('http.bytes', size)
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов: не более rate запросов в секунду
+       с допустимым всплеском до capacity запросов"""
+
+    def __init__(self, rate: float, capacity: 'int | None' = None):
+        import asyncio
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Ожидает, пока в корзине появится токен, и забирает его"""
+        import asyncio
+        async with self.lock:
+            while True:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+                metrics.add_time('http.rate_limit_wait', delay)
+                await asyncio.sleep(delay)
+
+
+def query_params(params: 'dict | None') -> 'List[Tuple[str, str]] | None':
+    """Приводит параметры запроса к виду, который принимает aiohttp:
+       списки разворачиваются в повторяющиеся параметры, None отбрасываются"""
+    if params is None:
+        return None
+    query = []
+    for key, values in params.items():
+        for value in values if isinstance(values, list) else [values]:
+            if value is None:
+                continue
+            query.append((key, str(value).lower() if isinstance(value, bool) else str(value)))
+    return query
+
+
+async def get_data_by_api_async(session: 'aiohttp.ClientSession', url: str, params: 'dict | None' = None, *,
+                                bucket: 'TokenBucket | None' = None, attempts: int = 3,
+                                timeout: float = 10, cache: 'ResponseCache | None' = None) -> dict:
+    """Асинхронно парсит данные с сайта по url api с заданными параметрами"""
+    import asyncio
+    import aiohttp
+    query = query_params(params)
+    if cache is not None:
+        key = cache.key(url, query)
+        data, entry = cache.lookup(key)
+        if data is not None:
+            return data
+    for _try in range(attempts):
+        if bucket is not None:
+            await bucket.acquire()
+        retry_after = None
+        headers = cache.conditional_headers(entry) if cache is not None else None
+        start = perf_counter()
+        try:
+            async with session.get(url, params=query, headers=headers,
+                                   timeout=aiohttp.ClientTimeout(total=timeout)) as result:
+                body = await result.read()
+                observe_response(start, result.status, len(body))
+                if result.status == 304 and cache is not None:
+                    return cache.not_modified(url, key, entry)
+                if result.status == 200:
+                    if cache is not None:
+                        cache.store(url, key, body, result.headers)
+                    return json.loads(body)
+                print('Returned error code:', result.status, 'URL:', result.url)
+                retry_after = result.headers.get('Retry-After')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            observe_response(start, type(ex).__name__, 0)
+            print(f'Request failed cause {ex!r}', 'URL:', url)
+        print(f'Attempt {_try + 1} from {attempts}')
+        if _try + 1 < attempts:
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** _try
+            metrics.add_time('http.retry_wait', delay)
+            await asyncio.sleep(delay)
+    print('All attempts have been exhausted.',
+          'Perhaps the given url is currently unreachable. Try again later', sep='\n')
+    return {}
+
+
+async def fetch_all(urls: List[str], concurrency: int = 8, rate: float = 5,
+                    timeout: float = 10, attempts: int = 3,
+                    cache: 'ResponseCache | None' = None) -> List[dict]:
+    """Асинхронно загружает данные по списку url через общий пул соединений.
+       Одновременно выполняется не более concurrency запросов, не чаще rate запросов в секунду"""
+    import asyncio
+    import aiohttp
+    bucket = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(url: str) -> dict:
+        async with semaphore:
+            return await get_data_by_api_async(session, url, bucket=bucket,
+                                               attempts=attempts, timeout=timeout, cache=cache)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(*(fetch(url) for url in urls))
+
+
+async def iter_pages(url: str, params: dict, num_vac: 'int | None' = None, concurrency: int = 8,
+                     rate: float = 5, timeout: float = 10, attempts: int = 3,
+                     cache: 'ResponseCache | None' = None) -> AsyncIterator[List[dict]]:
+    """Асинхронно постранично загружает список по url api с заданными параметрами.
+       После первой страницы известно количество страниц, остальные загружаются конкурентно:
+       в работе не более concurrency страниц, новые запрашиваются по мере выдачи готовых.
+       Возвращает элементы (items) страниц в порядке их готовности,
+       не запрашивая страницы сверх необходимых для num_vac элементов"""
+    import asyncio
+    import aiohttp
+    bucket = TokenBucket(rate)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def fetch(page: int) -> dict:
+            return await get_data_by_api_async(session, url, {**params, 'page': page},
+                                               bucket=bucket, attempts=attempts, timeout=timeout, cache=cache)
+
+        data = await fetch(params.get('page', 0))
+        found, page, pages = data.get('found', 0), data.get('page', 0), data.get('pages', 1)
+        print(f'\tНайдено: {found}, страниц: {pages}, страница: {page}')
+        yield data.get('items', [])
+
+        per_page = max(len(data.get('items', [])), 1)
+        if num_vac is not None:
+            pages = min(pages, page + ceil(min(found, num_vac) / per_page))
+        queue = list(range(pages - 1, page, -1))
+        tasks = set()
+        try:
+            while queue or tasks:
+                while queue and len(tasks) < concurrency:
+                    tasks.add(asyncio.create_task(fetch(queue.pop())))
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    data = task.result()
+                    print(f'\tСтраница {data.get("page")} из {pages}')
+                    yield data.get('items', [])
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def iter_async(agen: AsyncIterator) -> Iterator:
+    """Обходит асинхронный генератор из синхронного кода.
+       Цикл событий работает в отдельном потоке, поэтому уже запущенные
+       запросы продолжают выполняться, пока вызывающий код обрабатывает очередной элемент"""
+    import asyncio
+    loop = asyncio.new_event_loop()
+    thread = Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def run_async(coro: Coroutine):
+    """Запускает корутину, в т.ч. из Jupyter, где цикл событий уже запущен"""
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+def iter_threaded(func: Callable, items: Iterator, maxsize: int = 1) -> Iterator:
+    """Стадия конвейера: func применяется к элементам items в отдельном потоке,
+       результаты передаются через ограниченную очередь. Пока вызывающий код обрабатывает
+       очередной результат, стадия готовит не более maxsize следующих.
+       Исключение стадии пробрасывается вызывающему коду, при досрочном завершении
+       обхода стадия останавливается и закрывает items"""
+    queue = Queue(maxsize)
+    stop = Event()
+    done = object()
+
+    def put(item) -> bool:
+        start = perf_counter()
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=.1)
+                metrics.add_time('pipeline.put_wait', perf_counter() - start)
+                return True
+            except Full:
+                continue
+        return False
+
+    def worker():
+        try:
+            for item in items:
+                if not put((func(item), None)):
+                    break
+        except BaseException as ex:
+            put((None, ex))
+        finally:
+            if hasattr(items, 'close'):
+                items.close()
+            put((done, None))
+
+    thread = Thread(target=worker, daemon=True)
+    thread.start()
+    try:
+        start = perf_counter()
+        while True:
+            try:
+                result, ex = queue.get(timeout=.1)
+            except Empty:
+                if not thread.is_alive() and queue.empty():
+                    return
+                continue
+            metrics.add_time('pipeline.get_wait', perf_counter() - start)
+            if ex is not None:
+                raise ex
+            if result is done:
+                return
+            yield result
+            start = perf_counter()
+    finally:
+        stop.set()
+        thread.join()
+
+
+def get_details_by_api(urls: List[str], concurrency: int = 8, rate: float = 5,
+                       timeout: float = 10, attempts: int = 3,
+                       cache: 'ResponseCache | None' = None) -> List[dict]:
+    """Загружает детальные данные по списку url конкурентно, порядок результатов совпадает с urls"""
+    print(f'Загрузка {len(urls)} url, конкурентность: {concurrency}, не более {rate} запросов/с')
+    return run_async(fetch_all(urls, concurrency, rate, timeout, attempts, cache))
+
+
+def field_getter(path: str) -> Callable[[dict], Any]:
+    """Создаёт функцию извлечения значения из вложенного словаря по пути вида
+       'employer.id' (вложенный ключ), 'professional_roles[0].name' (элемент списка)
+       или 'key_skills[].name' (значения всех элементов списка через ', ', None для пустого списка)"""
+    steps = []
+    for part in path.split('.'):
+        match = re.fullmatch(r'(\w+)(?:\[(\d*)\])?', part)
+        key, index = match[1], match[2]
+        steps.append((key, None if index is None else int(index) if index else ...))
+
+    def getter(item: dict, steps: list = steps) -> Any:
+        value = item
+        for i, (key, index) in enumerate(steps):
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+            if index is None:
+                continue
+            if not isinstance(value, list):
+                return None
+            if index is ...:
+                values = [getter(element, steps[i + 1:]) for element in value]
+                return ', '.join(v for v in values if v is not None) or None
+            value = value[index] if index < len(value) else None
+        return value
+
+    return getter
+
+
+def flatten(items: List[dict], fields: Dict[str, 'str | Tuple[str, str]'],
+            index: 'pd.Index | None' = None) -> 'pd.DataFrame':
+    """Преобразует список вложенных словарей (ответов API) в DF за один проход.
+       fields - описание столбцов {столбец: путь} или {столбец: (путь, тип)},
+       синтаксис пути см. в field_getter"""
+    import pandas as pd
+    getters = {column: field_getter(field if isinstance(field, str) else field[0])
+               for column, field in fields.items()}
+    columns = {column: [] for column in fields}
+    for item in items:
+        for column, getter in getters.items():
+            columns[column].append(getter(item))
+    df = pd.DataFrame(columns, index=index, columns=list(fields))
+    dtypes = {column: field[1] for column, field in fields.items() if not isinstance(field, str)}
+    return df.astype(dtypes) if dtypes else df
+
+
 def data_parser(val: 'dict | List[dict] | None'):
+    import pandas as pd
     if isinstance(val, dict) or val is None:
         return pd.Series(val, dtype='O')
     elif isinstance(val, list):
@@ -114,71 +623,127 @@ def list_to_str(val):
 def update_table(
     table_name: str,
     db_name: str,
-    data: pd.DataFrame,
+    data: 'pd.DataFrame',
     if_exists: "Literal['fail'] | Literal['replace'] | Literal['append']" = 'append',
     many: bool = True,
     attempts: int = 3
 ):
-    # Обновляем таблицу (с удалением, чтобы избежать дублирования)
-    nrows = execute(query=get_query(f'delete_from_{table_name}.sql'),
-                    db_name=db_name,
-                    params=data.to_dict(orient='records'),
-                    many=many)
-    print('Удалено', nrows, 'строк(и) из таблицы', table_name)
-    # Запись DF в таблицу БД
-    persist_df(df=data,
-               table_name=table_name,
-               db_name=db_name,
-               if_exists=if_exists,
-               attempts=attempts)
-
-
-def persist_df(df: pd.DataFrame, table_name: str, db_name: str, *,
+    """Обновляет таблицу одной транзакцией.
+       Если для таблицы есть запрос upsert_into_<table_name>.sql, строки обновляются
+       массово через временную таблицу, иначе удаляются старые версии строк и записываются новые"""
+    session = Session.get(db_name)
+    metrics.count(f'update_table.{table_name}.rows_in', len(data))
+    try:
+        with metrics.timer(f'update_table.{table_name}'), session.transaction():
+            if (Path('sql') / f'upsert_into_{table_name}.sql').exists():
+                nrows = session.upsert_df(data, table_name, get_query(f'upsert_into_{table_name}.sql'))
+                metrics.count(f'update_table.{table_name}.rows_changed', nrows)
+                print(f'Данные записаны в БД в таблицу {table_name}. Обновлено/добавлено',
+                      nrows, 'строк(и)', end='\n\n')
+                return
+            # Обновляем таблицу (с удалением, чтобы избежать дублирования)
+            nrows = session.execute(get_query(f'delete_from_{table_name}.sql'),
+                                    params=data.to_dict(orient='records'),
+                                    many=many)
+            print('Удалено', nrows, 'строк(и) из таблицы', table_name)
+            # Запись DF в таблицу БД
+            persist_df(df=data,
+                       table_name=table_name,
+                       db_name=db_name,
+                       if_exists=if_exists,
+                       attempts=attempts)
+    except sqlite3.Error as ex:
+        print(f"\tUpdate of {table_name} failed cause {ex}")
+        if session.depth:  # ошибка откатывает всю внешнюю транзакцию
+            raise
+
+
+def persist_df(df: 'pd.DataFrame', table_name: str, db_name: str, *,
                index: bool = False, index_label: 'str | None' = None,
                if_exists: 'fail|replace|append' = 'append',
                attempts: int = 5):
     """Записывает DF в таблицу БД"""
-    for _try in range(attempts):  # sqllite does not supports concurrent access
+    session = Session.get(db_name)
+    if index:
+        df = df.reset_index(names=index_label)
+    for _try in range(attempts):
         try:
-            with sqlite3.connect(db_name) as connection:
-                while Path('hw1.db-journal').exists():  # await wile temp file in use
-                    sleep(.5)
-                df.to_sql(table_name, connection,
-                          if_exists=if_exists,
-                          index=index,
-                          index_label=index_label,
-                          method='multi')
-                connection.commit()
-                print(f'Данные записаны в БД в таблицу {table_name}. Записано',
-                      len(df), 'строк(и)', end='\n\n')
-                break
+            with metrics.timer(f'persist_df.{table_name}'):
+                session.insert_df(df, table_name, if_exists)
+            metrics.count(f'persist_df.{table_name}.rows', len(df))
+            print(f'Данные записаны в БД в таблицу {table_name}. Записано',
+                  len(df), 'строк(и)', end='\n\n')
+            break
         except sqlite3.Error as ex:
             print(f"\tPersist failed cause {ex}")
-            connection.rollback()
+            if session.depth:  # внутри внешней транзакции повтор невозможен
+                raise
             print(f'\tAttempt {_try + 1} from {attempts}')
-    connection.close()
+            sleep(.5)
+
+
+SKILL_RULES = dict(
+    remove=[r'\s?framework\s?'],
+    rules=[dict(search='python', name='python'),
+           dict(search='rest|fast|api', name='rest api'),
+           dict(search='django', name='django'),
+           dict(search='git', name='git'),
+           dict(search='sql', name='sql'),
+           dict(search='docker', name='docker'),
+           dict(equal=['asyncio', 'aiohttp', 'asinc.io', 'асинхронное программирование'],
+                name='асинхронное программирование'),
+           dict(equal=['go', 'golang'], name='go')]
+)
+
+
+class SkillNormalizer:
+    """Нормализатор ключевых навыков по таблице правил.
+       Правила проверяются по порядку: search - вхождение регулярного выражения,
+       equal - точное совпадение с одним из значений; remove - удаляемые фрагменты.
+       Все правила собираются в одно регулярное выражение, результаты запоминаются"""
+
+    def __init__(self, remove: 'List[str] | None' = None, rules: 'List[dict] | None' = None):
+        remove = SKILL_RULES['remove'] if remove is None else remove
+        rules = SKILL_RULES['rules'] if rules is None else rules
+        self.remove = re.compile('|'.join(f'(?:{pattern})' for pattern in remove)) if remove else None
+        self.names = [rule['name'] for rule in rules]
+        # Каждое правило - альтернатива с опережающей проверкой по всей строке,
+        # поэтому срабатывает первое по порядку правило, а не самое левое вхождение
+        alternatives = []
+        for i, rule in enumerate(rules):
+            if 'search' in rule:
+                condition = f'.*?(?:{rule["search"]})'
+            else:
+                condition = f'(?:{"|".join(map(re.escape, rule["equal"]))})\\Z'
+            alternatives.append(f'(?={condition})(?P<r{i}>)')
+        self.matcher = re.compile('|'.join(alternatives), re.DOTALL) if alternatives else None
+        self.cache = {}
+
+    def __call__(self, txt: 'str | None') -> 'str | None':
+        if not isinstance(txt, str):
+            return None
+        if txt not in self.cache:
+            self.cache[txt] = self.normalize_one(txt)
+        return self.cache[txt]
+
+    def normalize_one(self, txt: str) -> str:
+        txt = txt.lower().strip().strip('.')
+        if self.remove is not None:
+            txt = self.remove.sub('', txt)
+        match = self.matcher.match(txt) if self.matcher is not None else None
+        return self.names[int(match.lastgroup[1:])] if match else txt
+
+    def normalize(self, values: 'pd.Series') -> 'pd.Series':
+        """Нормализует столбец: правила применяются только к уникальным значениям"""
+        import numpy as np
+        import pandas as pd
+        codes, uniques = pd.factorize(values)
+        normalized = np.array([self(value) for value in uniques] + [None], dtype=object)
+        return pd.Series(normalized[codes], index=values.index, dtype=object)
+
+
+default_normalizer = SkillNormalizer()
 
 
 def normalizer(txt: 'str | None') -> 'str | None':
-    import re
-    if not isinstance(txt, str):
-        return None
-    txt = txt.lower().strip().strip('.')
-    txt = re.sub(r'\s?framework\s?', '', txt)
-    if re.search('python', txt):
-        return 'python'
-    if re.search('rest|fast|api', txt):
-        return 'rest api'
-    if re.search('django', txt):
-        return 'django'
-    if re.search('git', txt):
-        return 'git'
-    if re.search('sql', txt):
-        return 'sql'
-    if re.search('docker', txt):
-        return 'docker'
-    if txt in ('asyncio', 'aiohttp', 'asinc.io', 'асинхронное программирование'):
-        return 'асинхронное программирование'
-    if txt in ('go', 'golang'):
-        return 'go'
-    return txt
+    return default_normalizer(txt)